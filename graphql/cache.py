@@ -0,0 +1,113 @@
+"""
+Кэш ответов GraphQL: ограниченный LRU с TTL и single-flight.
+Конкурентные одинаковые запросы ждут один и тот же вызов к API.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+@dataclass
+class CacheStats:
+    """Статистика кэша"""
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0  # Запросы, дождавшиеся уже выполняющегося одинакового запроса
+    evictions: int = 0
+    expirations: int = 0
+    saved_seconds: float = 0.0  # Сумма времени исходных запросов, которые не пришлось повторять
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.coalesced + self.misses
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+
+def normalize_variables(variables: Optional[dict[str, Any]]) -> str:
+    """Ключ переменных, не зависящий от порядка полей"""
+    return json.dumps(variables or {}, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ResponseCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        # ключ -> (ответ, момент истечения, время исходного запроса)
+        self._entries: OrderedDict[Hashable, tuple[Any, float, float]] = OrderedDict()
+        # ключ -> (задача выполняющегося запроса, момент ее начала)
+        self._in_flight: dict[Hashable, tuple[asyncio.Task, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """Поиск в кэше: (найдено, ответ)"""
+        found, value = self._lookup(key)
+        if not found:
+            self.stats.misses += 1
+        return found, value
+
+    def _lookup(self, key: Hashable) -> tuple[bool, Any]:
+        """Поиск без учета промаха: get_or_fetch считает промах только если сам идет в API"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at, fetch_seconds = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats.expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        self.stats.saved_seconds += fetch_seconds
+        return True, value
+
+    def set(self, key: Hashable, value: Any, fetch_seconds: float = 0.0) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl, fetch_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Ответ из кэша или из fetch(); одинаковые конкурентные вызовы выполняют fetch один раз"""
+        found, value = self._lookup(key)
+        if found:
+            return value
+
+        if key in self._in_flight:
+            task, fetch_started = self._in_flight[key]
+            self.stats.coalesced += 1
+            # Собственный запрос закончился бы на столько позже, насколько позже он бы начался
+            self.stats.saved_seconds += time.perf_counter() - fetch_started
+        else:
+            self.stats.misses += 1
+            # fetch выполняется в отдельной задаче: отмена одного из ожидающих (в том числе
+            # первого) не отменяет запрос и не передает CancelledError остальным
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            task.add_done_callback(self._retrieve_exception)
+            self._in_flight[key] = (task, time.perf_counter())
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Запрос к API; ошибки не кэшируются, но достаются всем ожидающим"""
+        started = time.perf_counter()
+        try:
+            value = await fetch()
+            self.set(key, value, time.perf_counter() - started)
+            return value
+        finally:
+            del self._in_flight[key]
+
+    @staticmethod
+    def _retrieve_exception(task: asyncio.Task) -> None:
+        # Если все ожидающие отменены, ошибку некому забрать - без этого asyncio пишет "never retrieved"
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,388 @@
+"""
+Переиспользуемый GraphQL клиент.
+
+- одна aiohttp-сессия с пулом соединений на все запросы (без TCP/TLS рукопожатия на каждый запрос)
+- execute_batch: несколько вызовов одного GqlRequestEnum с разными переменными
+  объединяются в один документ через алиасы и отправляются одним HTTP-запросом
+- load: DataLoader-подобная склейка конкурентных запросов в пределах одного тика event loop
+- документы запросов разбираются и валидируются по схеме один раз, ответы кэшируются в ResponseCache
+"""
+import asyncio
+from contextvars import ContextVar
+from copy import copy
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Mapping, Optional
+
+import aiohttp
+from gql import Client
+from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.exceptions import TransportQueryError
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    GraphQLSchema,
+    NameNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    VariableNode,
+    Visitor,
+    build_schema,
+    parse,
+    validate,
+    visit,
+)
+
+from cache import ResponseCache, normalize_variables
+from gql_enum import GqlRequestEnum
+
+
+@dataclass
+class ResponseInfo:
+    """Заголовки HTTP-ответа конкретного вызова execute (лимиты запросов, Retry-After)"""
+    headers: Mapping[str, str] = field(default_factory=dict)
+
+
+# ResponseInfo текущего вызова; транспорт заполняет его, даже если запрос завершился ошибкой
+_response_info: ContextVar[Optional[ResponseInfo]] = ContextVar("gql_response_info", default=None)
+
+
+class _HeadersTransport(AIOHTTPTransport):
+    """
+    AIOHTTPTransport хранит заголовки последнего ответа в общем поле, и при конкурентных
+    запросах они могут принадлежать чужому запросу. Здесь они еще и передаются в ResponseInfo вызова.
+    """
+    _last_headers: Optional[Mapping[str, str]] = None
+
+    @property
+    def response_headers(self) -> Optional[Mapping[str, str]]:
+        return self._last_headers
+
+    @response_headers.setter
+    def response_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        self._last_headers = headers
+        info = _response_info.get()
+        if info is not None and headers is not None:
+            info.headers = headers
+
+
+class _RenameVariables(Visitor):
+    """Добавление суффикса к именам переменных ($search -> $search_0)"""
+
+    def __init__(self, suffix: str):
+        super().__init__()
+        self.suffix = suffix
+
+    def enter_variable(self, node: VariableNode, *_):
+        return VariableNode(name=NameNode(value=f"{node.name.value}{self.suffix}"))
+
+
+class _CollectVariables(Visitor):
+    def __init__(self):
+        super().__init__()
+        self.found = False
+
+    def enter_variable(self, node: VariableNode, *_):
+        self.found = True
+
+
+@lru_cache(maxsize=256)
+def build_batch_document(query: str, count: int) -> tuple[DocumentNode, list[list[tuple[str, str]]]]:
+    """
+    Объединение count копий запроса в один документ.
+    Переменные каждой копии получают суффикс _<номер>, поля верхнего уровня - алиас b<номер>_<ключ>.
+    Возвращает документ и для каждой копии пары (алиас в ответе, исходный ключ ответа).
+    """
+    document = parse(query)
+    operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+    fragments = [d for d in document.definitions if isinstance(d, FragmentDefinitionNode)]
+    if len(operations) != 1:
+        raise ValueError("Batched document must contain exactly one operation")
+    for fragment in fragments:
+        collector = _CollectVariables()
+        visit(fragment, collector)
+        if collector.found:
+            raise ValueError(f"Fragment '{fragment.name.value}' uses variables and cannot be batched")
+
+    operation = operations[0]
+    variable_definitions = []
+    selections = []
+    keys = []
+    for index in range(count):
+        renamed = visit(operation, _RenameVariables(f"_{index}"))
+        variable_definitions.extend(renamed.variable_definitions or ())
+        copy_keys = []
+        for selection in renamed.selection_set.selections:
+            if not isinstance(selection, FieldNode):
+                raise ValueError("Only field selections can be batched at the top level")
+            key = selection.alias.value if selection.alias else selection.name.value
+            field = copy(selection)
+            field.alias = NameNode(value=f"b{index}_{key}")
+            selections.append(field)
+            copy_keys.append((field.alias.value, key))
+        keys.append(copy_keys)
+
+    merged = OperationDefinitionNode(
+        operation=operation.operation,
+        name=operation.name,
+        directives=operation.directives,
+        variable_definitions=tuple(variable_definitions),
+        selection_set=SelectionSetNode(selections=tuple(selections)),
+    )
+    return DocumentNode(definitions=(merged, *fragments)), keys
+
+
+def batch_variables(variables_list: list[Optional[dict[str, Any]]]) -> dict[str, Any]:
+    """Переменные объединенного документа с суффиксами, как в build_batch_document"""
+    return {
+        f"{name}_{index}": value
+        for index, variables in enumerate(variables_list)
+        for name, value in (variables or {}).items()
+    }
+
+
+class GqlClient:
+    """GraphQL клиент с постоянной сессией, пакетным выполнением и склейкой конкурентных запросов"""
+
+    def __init__(
+            self,
+            url: str,
+            headers: Optional[dict[str, str]] = None,
+            pool_size: int = 100,  # Максимум одновременных соединений в пуле
+            max_batch_size: int = 50,  # Максимум запросов в одном объединенном документе
+            batch_window: float = 0.0,  # Сколько ждать запросы для склейки, 0 - до конца текущего тика
+            timeout: int = 30,
+            schema: Optional[GraphQLSchema | str] = None,  # Схема (или SDL) для проверки документов
+            cache: Optional[ResponseCache] = None,
+    ):
+        self.url = url
+        self.headers = headers
+        self.pool_size = pool_size
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.schema = build_schema(schema) if isinstance(schema, str) else schema
+        self.cache = cache
+        self._validated: set[GqlRequestEnum] = set()
+        self.client: Optional[Client] = None
+        self.session = None
+        # Ожидающие склейки запросы: тип запроса -> {ключ переменных: (переменные, future)}
+        self._pending: dict[GqlRequestEnum, dict[str, tuple[Optional[dict], asyncio.Future]]] = {}
+        self._timers: dict[GqlRequestEnum, asyncio.Handle] = {}  # Отложенная отправка текущей пачки
+        self._batches: set[asyncio.Task] = set()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        """Открытие сессии с пулом соединений"""
+        transport = _HeadersTransport(
+            url=self.url,
+            headers=self.headers,
+            timeout=self.timeout,
+            client_session_args={
+                # Соединения переиспользуются между запросами (keep-alive)
+                "connector": aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            },
+        )
+        # execute_timeout по умолчанию 10 с и ограничивает каждый execute() поверх таймаута сессии
+        self.client = Client(transport=transport, fetch_schema_from_transport=False, execute_timeout=self.timeout)
+        self.session = await self.client.connect_async()
+
+    async def close(self) -> None:
+        """Отправка накопленных запросов и закрытие сессии"""
+        for request in list(self._pending):
+            self._dispatch(request)
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        if self.client:
+            await self.client.close_async()
+            self.client = None
+            self.session = None
+
+    @property
+    def response_headers(self) -> Mapping[str, str]:
+        """
+        Заголовки последнего HTTP-ответа любого запроса клиента.
+        При конкурентных запросах используйте execute(..., response=ResponseInfo()).
+        """
+        transport = self.client.transport if self.client else None
+        return getattr(transport, "response_headers", None) or {}
+
+    def _document(self, request: GqlRequestEnum) -> DocumentNode:
+        """Разобранный документ запроса; проверка по схеме - только при первом использовании"""
+        document = request.document
+        if self.schema is not None and request not in self._validated:
+            errors = validate(self.schema, document)
+            if errors:
+                raise errors[0]
+            self._validated.add(request)
+        return document
+
+    async def execute(
+            self,
+            request: GqlRequestEnum,
+            variables: Optional[dict[str, Any]] = None,
+            response: Optional[ResponseInfo] = None,
+    ) -> dict:
+        """
+        Выполнение одного запроса.
+        response заполняется заголовками ответа именно этого запроса (и при ошибке);
+        при ответе из кэша или ожидании одинакового запроса остается пустым.
+        """
+        document = self._document(request)
+        token = _response_info.set(response)
+        try:
+            if self.cache is None:
+                return await self.session.execute(document, variable_values=variables)
+            return await self.cache.get_or_fetch(
+                (request, normalize_variables(variables)),
+                lambda: self.session.execute(document, variable_values=variables),
+            )
+        finally:
+            _response_info.reset(token)
+
+    async def execute_batch(
+            self,
+            request: GqlRequestEnum,
+            variables_list: list[Optional[dict[str, Any]]],
+            return_exceptions: bool = False,
+    ) -> list[Any]:
+        """
+        Выполнение запроса с разными переменными одним HTTP-запросом на каждые max_batch_size вызовов.
+        Результаты возвращаются в порядке variables_list. Как в asyncio.gather: при
+        return_exceptions=True ошибки отдельных вызовов возвращаются в списке, иначе первая выбрасывается.
+        Ответы, найденные в кэше, повторно не запрашиваются.
+        """
+        self._document(request)
+        results: list[Any] = [None] * len(variables_list)
+        missing = []
+        for index, variables in enumerate(variables_list):
+            found, value = self.cache.get((request, normalize_variables(variables))) if self.cache is not None else (False, None)
+            if found:
+                results[index] = value
+            else:
+                missing.append(index)
+        await self._fetch_missing(request, variables_list, missing, results)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    async def _fetch_missing(
+            self,
+            request: GqlRequestEnum,
+            variables_list: list[Optional[dict[str, Any]]],
+            missing: list[int],
+            results: list[Any],
+    ) -> None:
+        """Запрос вызовов с индексами missing (без поиска в кэше) и запись ответов в results и кэш"""
+        self._document(request)
+
+        async def run_chunk(chunk: list[int]) -> None:
+            started = asyncio.get_running_loop().time()
+            chunk_results = await self._execute_chunk(request, [variables_list[index] for index in chunk])
+            elapsed = asyncio.get_running_loop().time() - started
+            for index, result in zip(chunk, chunk_results):
+                results[index] = result
+                if self.cache is not None and not isinstance(result, Exception):
+                    self.cache.set((request, normalize_variables(variables_list[index])), result, elapsed)
+
+        # Пачки уходят параллельно по соединениям из пула, а не одна за другой
+        await asyncio.gather(*(
+            run_chunk(missing[start:start + self.max_batch_size])
+            for start in range(0, len(missing), self.max_batch_size)
+        ))
+
+    async def _execute_chunk(
+            self,
+            request: GqlRequestEnum,
+            variables_list: list[Optional[dict[str, Any]]],
+    ) -> list[Any]:
+        document, keys = build_batch_document(request.value, len(variables_list))
+        errors = []
+        try:
+            data = await self.session.execute(document, variable_values=batch_variables(variables_list))
+        except TransportQueryError as e:
+            if e.data is None:
+                return [e] * len(variables_list)
+            data, errors = e.data, e.errors or []
+
+        # Ошибки без пути относятся ко всему документу
+        if any(not error.get("path") for error in errors):
+            failed = TransportQueryError(str(errors[0]), errors=errors, data=data)
+            return [failed] * len(variables_list)
+
+        results = []
+        for copy_keys in keys:
+            aliases = {alias for alias, _ in copy_keys}
+            own_errors = [error for error in errors if error["path"][0] in aliases]
+            own_data = {key: data.get(alias) for alias, key in copy_keys}
+            if own_errors:
+                results.append(TransportQueryError(str(own_errors[0]), errors=own_errors, data=own_data))
+            else:
+                results.append(own_data)
+        return results
+
+    async def load(self, request: GqlRequestEnum, variables: Optional[dict[str, Any]] = None) -> dict:
+        """
+        Запрос, который склеивается с конкурентными запросами того же типа в один HTTP-запрос.
+        Одинаковые переменные в пределах пачки выполняются один раз.
+        """
+        if self.cache is None:
+            return await self._load(request, variables)
+        return await self.cache.get_or_fetch(
+            (request, normalize_variables(variables)),
+            lambda: self._load(request, variables),
+        )
+
+    async def _load(self, request: GqlRequestEnum, variables: Optional[dict[str, Any]]) -> dict:
+        loop = asyncio.get_running_loop()
+        key = normalize_variables(variables)
+        pending = self._pending.setdefault(request, {})
+        if key not in pending:
+            pending[key] = (variables, loop.create_future())
+            if len(pending) == 1:
+                if self.batch_window:
+                    self._timers[request] = loop.call_later(self.batch_window, self._dispatch, request)
+                else:
+                    self._timers[request] = loop.call_soon(self._dispatch, request)
+            if len(pending) >= self.max_batch_size:
+                self._dispatch(request)
+        _, future = pending[key]
+        # shield: отмена одного ожидающего не должна отменять результат для остальных
+        return await asyncio.shield(future)
+
+    def _dispatch(self, request: GqlRequestEnum) -> None:
+        """Отправка накопленной пачки запросов"""
+        # Пачка могла уйти раньше по max_batch_size: таймер не должен отправить следующую досрочно
+        timer = self._timers.pop(request, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(request, None)
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch(request, list(batch.values())))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, request: GqlRequestEnum, batch: list[tuple[Optional[dict], asyncio.Future]]):
+        results: list[Any] = [None] * len(batch)
+        try:
+            # Кэш уже проверен в load(), повторный поиск засчитал бы лишний промах
+            await self._fetch_missing(request, [variables for variables, _ in batch], list(range(len(batch))), results)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
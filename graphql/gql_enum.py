@@ -1,4 +1,9 @@
 from enum import Enum
+from functools import lru_cache
+
+from gql import gql
+from graphql import DocumentNode
+
 
 class GqlRequestEnum(Enum):
     search = (
@@ -12,4 +17,34 @@ class GqlRequestEnum(Enum):
           }
         }
         """
-    )
\ No newline at end of file
+    )
+    search_page = (
+        """
+        query ($search: String, $page: Int, $perPage: Int) {
+          Page (page: $page, perPage: $perPage) {
+            pageInfo {
+              currentPage
+              lastPage
+              hasNextPage
+            }
+            media (search: $search) {
+              id
+              title {
+                english
+              }
+            }
+          }
+        }
+        """
+    )
+
+    @property
+    def document(self) -> DocumentNode:
+        """Разобранный документ запроса (парсится один раз, при первом обращении)"""
+        return parse_request(self)
+
+
+@lru_cache(maxsize=None)
+def parse_request(request: GqlRequestEnum) -> DocumentNode:
+    """Кэш разобранных документов по элементу перечисления"""
+    return gql(request.value)
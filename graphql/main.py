@@ -1,31 +1,30 @@
 import asyncio
-from gql import gql, Client
+from client import GqlClient
 from gql_enum import GqlRequestEnum
-from gql.transport.aiohttp import AIOHTTPTransport
 
 
 async def main():
-    # Настройка асинхронного транспорта
-    transport = AIOHTTPTransport(
-        url="https://example.com"  # Пример публичного API
-    )
-
-    # Создание клиента
-    async with Client(
-            transport=transport,
-    ) as session:
-        # Запрос данных о миссиях SpaceX
-        query = gql(GqlRequestEnum.search.value)
+    # Клиент держит одну aiohttp-сессию с пулом соединений на все запросы
+    async with GqlClient(
+            url="https://example.com"  # Пример публичного API
+    ) as client:
         variables = {
             'search': ""
         }
 
         # Выполнение запроса
-        result = await session.execute(query, variable_values=variables)
+        result = await client.execute(GqlRequestEnum.search, variables)
         return result
 
 
+async def search_many(client: GqlClient, titles: list[str]) -> list[dict]:
+    """Поиск нескольких тайтлов: конкурентные load() уходят одним HTTP-запросом"""
+    return await asyncio.gather(*(
+        client.load(GqlRequestEnum.search, {'search': title}) for title in titles
+    ))
+
+
 # Запуск асинхронной функции
 if __name__ == "__main__":
     result = asyncio.run(main())
-    print(result)
\ No newline at end of file
+    print(result)
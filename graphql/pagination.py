@@ -0,0 +1,164 @@
+"""
+Потоковое чтение постраничных результатов (Page / pageInfo).
+
+Следующие страницы запрашиваются заранее, но не больше window одновременно, а элементы
+отдаются по порядку страниц по мере поступления. В памяти - не больше window страниц.
+Конкурентность подстраивается под лимиты сервера (X-RateLimit-Remaining, 429 + Retry-After).
+"""
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Mapping, Optional
+
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+
+from client import GqlClient, ResponseInfo
+from gql_enum import GqlRequestEnum
+
+
+class AdaptiveConcurrency:
+    """Ограничение числа одновременных запросов по схеме AIMD"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, headers: Mapping[str, str]) -> None:
+        """Аддитивное увеличение; уменьшение, если остаток лимита меньше текущей конкурентности"""
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None and int(remaining) < self.limit:
+            self.limit = max(self.min_limit, self.limit - 1)
+        elif self.limit < self.max_limit:
+            self.limit += 1
+
+    def on_throttle(self) -> None:
+        """Мультипликативное уменьшение после ответа 429"""
+        self.limit = max(self.min_limit, self.limit // 2)
+
+
+def retry_after(headers: Mapping[str, str], default: float = 1.0) -> float:
+    """Пауза перед повтором по Retry-After (секунды или HTTP-дата) или X-RateLimit-Reset (unix time)"""
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return default
+
+
+def is_throttled(error: Exception) -> bool:
+    """
+    Ответ 429: без JSON gql выбрасывает TransportServerError, а с JSON-телом ошибок
+    (как у AniList: {"errors": [{"status": 429, ...}]}) - TransportQueryError
+    """
+    if isinstance(error, TransportServerError):
+        return error.code == 429
+    if isinstance(error, TransportQueryError):
+        return any(isinstance(e, dict) and e.get("status") == 429 for e in error.errors or ())
+    return False
+
+
+def _dig(data: Optional[dict], path: tuple[str, ...]) -> Any:
+    for key in path:
+        if data is None:
+            return None
+        data = data.get(key)
+    return data
+
+
+async def paginate(
+        client: GqlClient,
+        request: GqlRequestEnum,
+        variables: Optional[dict[str, Any]] = None,
+        items_path: tuple[str, ...] = ("Page", "media"),
+        page_info_path: tuple[str, ...] = ("Page", "pageInfo"),
+        per_page: int = 50,
+        window: int = 4,  # Максимум страниц, запрошенных заранее (и хранимых в памяти)
+        max_pages: Optional[int] = None,
+        max_retries: int = 5,
+) -> AsyncIterator[dict]:
+    """
+    Асинхронный генератор элементов всех страниц запроса.
+    Запрос должен принимать переменные $page и $perPage и возвращать pageInfo
+    с hasNextPage (и, если есть, lastPage).
+    """
+    limiter = AdaptiveConcurrency(max_limit=window)
+
+    async def fetch(page: int) -> dict:
+        page_variables = {**(variables or {}), "page": page, "perPage": per_page}
+        for attempt in range(max_retries + 1):
+            # Заголовки именно этого запроса: client.response_headers общие для всех страниц окна
+            response = ResponseInfo()
+            async with limiter:
+                try:
+                    data = await client.execute(request, page_variables, response=response)
+                except (TransportServerError, TransportQueryError) as e:
+                    if not is_throttled(e) or attempt == max_retries:
+                        raise
+                    limiter.on_throttle()
+                    pause = retry_after(response.headers)
+                else:
+                    limiter.on_success(response.headers)
+                    return data
+            logging.warning(f"Page {page} throttled, retry in {pause:.1f}s (concurrency {limiter.limit})")
+            await asyncio.sleep(pause)
+
+    tasks: dict[int, asyncio.Task] = {}
+    next_to_fetch = 1
+    next_to_yield = 1
+    last_page = max_pages
+    try:
+        while True:
+            # Заполняем окно упреждающих запросов
+            while len(tasks) < window and (last_page is None or next_to_fetch <= last_page):
+                tasks[next_to_fetch] = asyncio.create_task(fetch(next_to_fetch))
+                next_to_fetch += 1
+            if next_to_yield not in tasks:
+                return
+
+            data = await tasks.pop(next_to_yield)
+            items = _dig(data, items_path) or []
+            page_info = _dig(data, page_info_path) or {}
+            for item in items:
+                yield item
+
+            if not items or not page_info.get("hasNextPage"):
+                return
+            if page_info.get("lastPage"):
+                last_page = min(last_page or page_info["lastPage"], page_info["lastPage"])
+            next_to_yield += 1
+    finally:
+        # Страницы за последней не нужны: отменяем упреждающие запросы
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+
+def stream_media(client: GqlClient, search: str, per_page: int = 50, window: int = 4) -> AsyncIterator[dict]:
+    """Поток всех Media по поисковой строке"""
+    return paginate(client, GqlRequestEnum.search_page, {"search": search}, per_page=per_page, window=window)
@@ -0,0 +1,361 @@
+"""
+Офлайн-бенчмарк AsyncKafkaProducer -> AsyncKafkaConsumer на mock-кластере librdkafka.
+
+Брокер не нужен: кластер поднимается внутри процесса (test.mock.num.brokers).
+Mock-кластер не поддерживает CreateTopics, топики создаются автоматически с
+MOCK_TOPIC_PARTITIONS партициями, поэтому число партиций сценария - это число
+партиций, в которые пишет продюсер (не больше MOCK_TOPIC_PARTITIONS).
+
+Запуск:
+    python kafka_benchmark.py --messages 20000 --sizes 100,1000 --partitions 1,6
+    python kafka_benchmark.py --save-baseline          # сохранить результаты как эталон
+    python kafka_benchmark.py --baseline baseline.json # сравнить с эталоном (файл обязан существовать)
+
+Пропускная способность и задержка замеряются без tracemalloc (он замедляет аллокации в разы),
+пик памяти Python - отдельным прогоном того же сценария.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, asdict
+from itertools import product
+from pathlib import Path
+from typing import Any, Callable
+
+from confluent_kafka import Message, Producer
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "consumer_service"))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "producer_service"))
+
+from kafka_consumer import AsyncKafkaConsumer  # noqa: E402
+from kafka_producer import AsyncKafkaProducer  # noqa: E402
+
+SENT_AT_HEADER = "bench-sent-ns"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+MOCK_TOPIC_PARTITIONS = 4  # Количество партиций автосоздаваемого топика в mock-кластере
+# Mock-брокер хранит ограниченный объем лога и удаляет старые сообщения,
+# поэтому продюсер не уходит вперед консьюмера больше чем на это окно
+MAX_UNCONSUMED_BYTES = 4 * 2 ** 20
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+@dataclass
+class Scenario:
+    """Параметры одного прогона"""
+    message_size: int
+    partitions: int
+    serializer: str  # json | str | bytes
+    handler: str  # none | const:<ms> | exp:<ms> | uniform:<ms>-<ms>
+
+    @property
+    def name(self) -> str:
+        return f"size={self.message_size} partitions={self.partitions} serializer={self.serializer} handler={self.handler}"
+
+
+@dataclass
+class ScenarioResult:
+    """Результаты прогона"""
+    name: str
+    messages: int
+    seconds: float
+    throughput_msgs: float
+    throughput_mb: float
+    p50_ms: float
+    p99_ms: float
+    peak_python_mb: float  # Пик tracemalloc в отдельном прогоне, 0 - не замерялся
+    rss_growth_mb: float  # Прирост RSS процесса за время сценария
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def handler_delay(spec: str) -> Callable[[], float]:
+    """Генератор задержки обработчика в секундах по описанию распределения"""
+    kind, _, arg = spec.partition(":")
+    if kind == "none":
+        return lambda: 0.0
+    if kind == "const":
+        return lambda: float(arg) / 1000
+    if kind == "exp":
+        return lambda: random.expovariate(1000 / float(arg))
+    if kind == "uniform":
+        low, high = (float(x) / 1000 for x in arg.split("-"))
+        return lambda: random.uniform(low, high)
+    raise ValueError(f"Unknown handler latency distribution: {spec}")
+
+
+def make_payload(serializer: str, size: int) -> Any:
+    """Сообщение заданного размера в формате, который сериализует AsyncKafkaProducer"""
+    data = "x" * size
+    if serializer == "json":
+        return {"data": data}
+    if serializer == "str":
+        return data
+    if serializer == "bytes":
+        return data.encode("utf-8")
+    raise ValueError(f"Unknown serializer: {serializer}")
+
+
+def current_rss() -> int:
+    """Текущий RSS процесса в байтах (Linux); ru_maxrss не подходит - это пик с запуска процесса"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+async def sample_peak_rss(peak: list[int]):
+    """Фоновый замер максимального RSS, peak[0] обновляется на месте"""
+    while True:
+        peak[0] = max(peak[0], current_rss())
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+
+def start_mock_cluster(num_brokers: int) -> tuple[Producer, str]:
+    """
+    Запуск mock-кластера librdkafka.
+    Кластер живет, пока существует клиент-владелец, поэтому он возвращается вызывающему.
+    """
+    owner = Producer({"test.mock.num.brokers": num_brokers})
+    metadata = owner.list_topics(timeout=10)
+    bootstrap = ",".join(f"{b.host}:{b.port}" for b in metadata.brokers.values())
+    return owner, bootstrap
+
+
+class BenchmarkConsumer(AsyncKafkaConsumer):
+    """Консьюмер, замеряющий end-to-end задержку вместо бизнес-логики"""
+
+    def __init__(self, *args, expected: int, delay: Callable[[], float], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expected = expected
+        self.delay = delay
+        self.latencies: list[float] = []
+        self.done = asyncio.Event()
+
+    async def handle(self, msg: Message):
+        headers = dict(msg.headers() or [])
+        if SENT_AT_HEADER not in headers:
+            # Прогревочное сообщение, которым создавался топик
+            return
+        sent_at = int(headers[SENT_AT_HEADER])
+        pause = self.delay()
+        if pause:
+            await asyncio.sleep(pause)
+        self.latencies.append((time.perf_counter_ns() - sent_at) / 1e6)
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+
+async def run_scenario(
+        bootstrap: str,
+        scenario: Scenario,
+        messages: int,
+        timeout: float,
+        trace_memory: bool = False
+) -> ScenarioResult:
+    """Прогон сценария produce -> consume; trace_memory - замер пика памяти Python через tracemalloc"""
+    topic = f"bench-{uuid.uuid4().hex[:8]}"
+    producer_config = {"bootstrap.servers": bootstrap, "linger.ms": 5}
+    # Топик создается первым сообщением, до подписки консьюмера
+    async with AsyncKafkaProducer(producer_config) as producer:
+        await producer.produce(topic, b"warmup")
+
+    consumer = BenchmarkConsumer(
+        config={
+            "bootstrap.servers": bootstrap,
+            "group.id": f"{topic}-group",
+            "auto.offset.reset": "earliest",
+            # Mock-брокер не отвечает на fetch раньше fetch.wait.max.ms даже при наличии данных
+            "fetch.wait.max.ms": 10,
+        },
+        topics=[topic],
+        expected=messages,
+        delay=handler_delay(scenario.handler),
+    )
+    await consumer.start()
+    consuming = asyncio.create_task(consumer.start_consuming())
+
+    # Ждем назначения партиций, чтобы время вступления в группу не попало в замер
+    deadline = time.monotonic() + timeout
+    while not consumer.partitions:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Consumer was not assigned any partitions")
+        await asyncio.sleep(0.05)
+
+    payload = make_payload(scenario.serializer, scenario.message_size)
+    rss_before = current_rss()
+    peak_rss = [rss_before]
+    rss_sampler = asyncio.create_task(sample_peak_rss(peak_rss))
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    window = max(1, MAX_UNCONSUMED_BYTES // scenario.message_size)
+    async with AsyncKafkaProducer(producer_config) as producer:
+        for i in range(messages):
+            while i - len(consumer.latencies) >= window:
+                producer.producer.poll(0)
+                await asyncio.sleep(0.001)
+            while True:
+                try:
+                    await producer.produce(
+                        topic,
+                        payload,
+                        key=str(i),
+                        headers={SENT_AT_HEADER: str(time.perf_counter_ns())},
+                        partition=i % scenario.partitions,
+                    )
+                    break
+                except BufferError:
+                    # Локальная очередь librdkafka заполнена: отдаем управление и ждем отправки
+                    producer.producer.poll(0.01)
+                    await asyncio.sleep(0)
+            if i % 100 == 0:
+                producer.producer.poll(0)
+                await asyncio.sleep(0)
+
+    try:
+        await asyncio.wait_for(consumer.done.wait(), timeout=timeout)
+    finally:
+        seconds = time.perf_counter() - started
+        peak = 0
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        rss_sampler.cancel()
+        peak_rss[0] = max(peak_rss[0], current_rss())
+        consumer.is_running = False
+        await consuming
+        await consumer.stop()
+
+    latencies = sorted(consumer.latencies)
+    return ScenarioResult(
+        name=scenario.name,
+        messages=len(latencies),
+        seconds=round(seconds, 3),
+        throughput_msgs=round(len(latencies) / seconds, 1),
+        throughput_mb=round(len(latencies) * scenario.message_size / seconds / 2 ** 20, 2),
+        p50_ms=round(percentile(latencies, 50), 3),
+        p99_ms=round(percentile(latencies, 99), 3),
+        peak_python_mb=round(peak / 2 ** 20, 2),
+        rss_growth_mb=round((peak_rss[0] - rss_before) / 2 ** 20, 1),
+    )
+
+
+def compare_with_baseline(
+        results: list[ScenarioResult],
+        baseline: dict[str, dict],
+        threshold: float
+) -> list[str]:
+    """Поиск регрессий относительно эталона (threshold - допустимое ухудшение в процентах)"""
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.name)
+        if not reference:
+            continue
+        if result.throughput_msgs < reference["throughput_msgs"] * (1 - threshold / 100):
+            regressions.append(
+                f"{result.name}: throughput {result.throughput_msgs} < {reference['throughput_msgs']} msg/s"
+            )
+        if result.p99_ms > reference["p99_ms"] * (1 + threshold / 100):
+            regressions.append(f"{result.name}: p99 {result.p99_ms} > {reference['p99_ms']} ms")
+    return regressions
+
+
+def print_results(results: list[ScenarioResult]):
+    header = f"{'scenario':<70} {'msg/s':>10} {'MB/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'py MB':>7} {'+rss MB':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r.name:<70} {r.throughput_msgs:>10} {r.throughput_mb:>8} "
+            f"{r.p50_ms:>9} {r.p99_ms:>9} {r.peak_python_mb:>7} {r.rss_growth_mb:>7}"
+        )
+
+
+def parse_list(value: str, cast: Callable = str) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+
+async def main(args: argparse.Namespace) -> int:
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    if args.baseline and not args.save_baseline and not args.baseline.exists():
+        logging.error(f"Baseline {args.baseline} does not exist, run with --save-baseline first")
+        return 2
+    owner, bootstrap = start_mock_cluster(args.brokers)
+    logging.info(f"Mock cluster started: {bootstrap}")
+    if max(args.partitions) > MOCK_TOPIC_PARTITIONS:
+        logging.warning(f"Mock topics have {MOCK_TOPIC_PARTITIONS} partitions, larger counts are capped")
+        args.partitions = sorted({min(p, MOCK_TOPIC_PARTITIONS) for p in args.partitions})
+
+    scenarios = [
+        Scenario(size, partitions, serializer, handler)
+        for size, partitions, serializer, handler in product(
+            args.sizes, args.partitions, args.serializers, args.handlers
+        )
+    ]
+    results = []
+    for scenario in scenarios:
+        logging.info(f"Running {scenario.name}")
+        result = await run_scenario(bootstrap, scenario, args.messages, args.timeout)
+        if args.memory:
+            # Отдельный прогон: tracemalloc не должен искажать пропускную способность и задержку
+            logging.info(f"Measuring memory for {scenario.name}")
+            memory = await run_scenario(bootstrap, scenario, args.messages, args.timeout, trace_memory=True)
+            result.peak_python_mb = memory.peak_python_mb
+        results.append(result)
+    print_results(results)
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps({r.name: asdict(r) for r in results}, indent=2))
+        logging.info(f"Baseline saved to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        logging.warning(
+            f"No baseline at {baseline_path}, regressions are not checked. "
+            f"Save one on the target machine with --save-baseline"
+        )
+        return 0
+    regressions = compare_with_baseline(results, json.loads(baseline_path.read_text()), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Kafka produce->consume benchmark")
+    parser.add_argument("--messages", type=int, default=10000, help="Сообщений на сценарий")
+    parser.add_argument("--sizes", type=lambda v: parse_list(v, int), default=[100, 1000, 10000])
+    parser.add_argument("--partitions", type=lambda v: parse_list(v, int), default=[1, 4])
+    parser.add_argument("--serializers", type=parse_list, default=["json", "bytes"])
+    parser.add_argument(
+        "--handlers", type=parse_list, default=["none", "exp:1"],
+        help="Распределения задержки обработчика: none, const:<ms>, exp:<ms>, uniform:<ms>-<ms>"
+    )
+    parser.add_argument("--brokers", type=int, default=3, help="Количество mock-брокеров")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Таймаут сценария в секундах")
+    parser.add_argument(
+        "--baseline", type=Path, default=None,
+        help=f"Файл эталона (по умолчанию {DEFAULT_BASELINE.name}); явно указанный файл обязан существовать"
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--no-memory", dest="memory", action="store_false", help="Не делать отдельный прогон с tracemalloc"
+    )
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимое ухудшение, %%")
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,65 +1,397 @@
 import asyncio
+import concurrent.futures
 import logging
 import json
+import time
+from dataclasses import dataclass, field
 from typing import Any, Dict, Optional
-from confluent_kafka import Consumer, Producer, Message
+from confluent_kafka import Consumer, Producer, Message, TopicPartition, KafkaException
+
+from instrumentation import SampledLogger, Trace, report_spans
+
+log = SampledLogger(logging.getLogger(__name__))
+
+
+@dataclass
+class PartitionState:
+    """Состояние назначенной консьюмеру партиции"""
+    topic: str
+    partition: int
+    assigned_at: float = field(default_factory=time.monotonic)
+    tail: Optional[asyncio.Task] = None  # Последняя задача в цепочке обработки партиции
+    last_offset: Optional[int] = None  # Offset последнего обработанного сообщения
+    stored_offset: Optional[int] = None  # Offset, уже переданный в store_offsets()
+    processed: int = 0
+
+
+@dataclass
+class RebalanceMetrics:
+    """Метрики ребалансировок консьюмера"""
+    rebalances: int = 0
+    assigned_partitions: int = 0
+    revoked_partitions: int = 0
+    lost_partitions: int = 0
+    drain_timeouts: int = 0
+    last_rebalance_seconds: float = 0.0
+    rebalance_seconds_total: float = 0.0
+    paused_seconds_total: float = 0.0  # Время, когда poll() стоял из-за ребалансировки или партиции были на паузе
+    backpressure_seconds_total: float = 0.0  # Время ожидания места среди обрабатываемых сообщений
 
 
 class AsyncKafkaConsumer:
     def __init__(
             self,
             config: Dict[str, Any],
-            topics: list[str]
+            topics: list[str],
+            max_in_flight: int = 100,
+            drain_timeout: float = 10.0,
+            batch_size: int = 500,
+            span_report_interval: float = 60.0  # Период вывода статистики этапов в лог, 0 - не выводить
     ):
-        self.config = config
+        self.config = {
+            # Кооперативная ребалансировка: при деплое отбираются только переезжающие партиции
+            'partition.assignment.strategy': 'cooperative-sticky',
+            # Offset сохраняется только после обработки сообщения, а не при poll()
+            'enable.auto.offset.store': False,
+            **config
+        }
         self.topics = topics
+        self.max_in_flight = max_in_flight  # Максимум сообщений в обработке одновременно
+        self.drain_timeout = drain_timeout  # Дедлайн на дообработку отзываемых партиций
+        self.batch_size = batch_size  # Максимум сообщений за один вызов consume()
+        self.span_report_interval = span_report_interval
+        self._span_reporter: Optional[asyncio.Task] = None
         self.consumer = None
         self.is_running = False
+        self.partitions: Dict[tuple[str, int], PartitionState] = {}
+        self.metrics = RebalanceMetrics()
+        self._cooperative = self.config['partition.assignment.strategy'] == 'cooperative-sticky'
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._polling: Optional[asyncio.Future] = None  # Текущий _poll_batch в executor
 
     async def start(self):
         """Запуск консьюмера"""
+        self._loop = asyncio.get_running_loop()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
         self.consumer = Consumer(self.config)
-        self.consumer.subscribe(self.topics)
+        self.consumer.subscribe(
+            self.topics,
+            on_assign=self._on_assign,
+            on_revoke=self._on_revoke,
+            on_lost=self._on_lost
+        )
         self.is_running = True
+        if self.span_report_interval:
+            # HTTP-эндпоинта у консьюмера нет, поэтому тайминги этапов видны только в логе
+            self._span_reporter = asyncio.create_task(report_spans(self.span_report_interval))
         logging.info("Kafka consumer started")
 
     async def stop(self):
         """Остановка консьюмера"""
         self.is_running = False
+        if self._span_reporter is not None:
+            self._span_reporter.cancel()
+            self._span_reporter = None
         if self.consumer:
-            self.consumer.close()
+            # poll() в executor не прерывается отменой задачи: close() нельзя вызывать, пока он идет
+            if self._polling is not None and not self._polling.done():
+                await asyncio.wait({self._polling})
+            # Дообрабатываем сообщения и коммитим offset до выхода из группы,
+            # close() вызывает on_revoke уже для пустого набора задач
+            offsets = await self._drain([
+                TopicPartition(state.topic, state.partition) for state in self.partitions.values()
+            ])
+            await self._loop.run_in_executor(None, self._commit_and_close, offsets)
         logging.info("Kafka consumer stopped")
 
+    def _commit_and_close(self, offsets: list[TopicPartition]):
+        """Синхронный коммит и закрытие консьюмера (выполняется в executor)"""
+        self._commit(self.consumer, offsets)
+        self.consumer.close()
+
     async def start_consuming(self):
         """Начало прослушки и обработки сообщений"""
         while self.is_running:
             try:
-                msg = await asyncio.get_event_loop().run_in_executor(
-                    None, self.consumer.poll, 1.0
+                self._polling = asyncio.get_event_loop().run_in_executor(
+                    None, self._poll_batch, 1.0
                 )
-                if msg and not msg.error():
-                    await self.handle(msg)
-                elif msg and msg.error():
-                    logging.error(f"Kafka error: {msg.error()}")
+                # shield: при отмене задачи future дождется завершения потока, и stop() сможет его подождать
+                messages = await asyncio.shield(self._polling)
+                for index, msg in enumerate(messages):
+                    if msg.error():
+                        logging.error(f"Kafka error: {msg.error()}")
+                        continue
+                    try:
+                        await self._dispatch(msg)
+                    except Exception as e:
+                        # Позиция консьюмера уже за всей пачкой: без seek offset следующих
+                        # сообщений партиции был бы закоммичен поверх необработанных
+                        logging.error(f"Dispatch error at {msg.topic()}[{msg.partition()}]@{msg.offset()}: {e}")
+                        await self._loop.run_in_executor(None, self._rewind, messages[index:])
+                        break
 
             except Exception as e:
                 logging.error(f"Consuming error: {e}")
                 await asyncio.sleep(1)
 
+    def _poll_batch(self, timeout: float) -> list[Message]:
+        """
+        Сохранение offset обработанных сообщений и чтение пачки (выполняется в executor).
+        store_offsets() ждет, пока другой поток находится в poll(), поэтому оба вызова
+        делаются из одного потока.
+        """
+        offsets = []
+        for state in list(self.partitions.values()):
+            if state.last_offset is not None and state.last_offset != state.stored_offset:
+                offsets.append(TopicPartition(state.topic, state.partition, state.last_offset + 1))
+                state.stored_offset = state.last_offset
+        if offsets:
+            try:
+                self.consumer.store_offsets(offsets=offsets)
+            except KafkaException as e:
+                logging.warning(f"Failed to store offsets: {e}")
+        # consume() ждет полную пачку до таймаута, поэтому ждем только первое сообщение,
+        # а остальное забираем из локальной очереди без ожидания
+        msg = self.consumer.poll(timeout)
+        if msg is None:
+            return []
+        return [msg, *self.consumer.consume(self.batch_size - 1, 0)]
+
+    async def _dispatch(self, msg: Message):
+        """Постановка сообщения в цепочку обработки его партиции"""
+        state = await self._acquire_partition(msg)
+        if state is None:
+            return
+        state.tail = asyncio.create_task(self._process_in_order(state, state.tail, msg))
+
+    async def _acquire_partition(self, msg: Message) -> Optional[PartitionState]:
+        """
+        Место для сообщения и состояние его партиции.
+        Пока ждем место, poll() при паузе может вызвать on_revoke, поэтому партиция
+        проверяется еще раз после ожидания; для отозванной место освобождается.
+        """
+        if (msg.topic(), msg.partition()) not in self.partitions:
+            # Партиция уже отозвана, сообщение получит новый владелец
+            return None
+        await self._acquire_slot()
+        state = self.partitions.get((msg.topic(), msg.partition()))
+        if state is None:
+            self._in_flight.release()
+        return state
+
+    async def _acquire_slot(self):
+        """
+        Место среди обрабатываемых сообщений (backpressure).
+        Если мест нет дольше секунды, партиции ставятся на паузу, а poll() продолжается,
+        чтобы консьюмер не был исключен из группы по max.poll.interval.ms.
+        """
+        if not self._in_flight.locked():
+            await self._in_flight.acquire()
+            return
+        loop = asyncio.get_running_loop()
+        waiting_since = time.monotonic()
+        paused_at: Optional[float] = None
+        acquire = asyncio.create_task(self._in_flight.acquire())
+        try:
+            try:
+                while not acquire.done():
+                    done, _ = await asyncio.wait({acquire}, timeout=1.0)
+                    if not done:
+                        if paused_at is None:
+                            paused_at = time.monotonic()
+                        await loop.run_in_executor(None, self._poll_paused)
+            finally:
+                if paused_at is not None:
+                    self.metrics.paused_seconds_total += time.monotonic() - paused_at
+                    await loop.run_in_executor(None, self._resume_assignment)
+        except BaseException:
+            # Отмена или ошибка Kafka в pause()/poll()/seek()/resume(): ожидание места отменяется,
+            # а уже полученное место возвращается, иначе оно было бы потеряно навсегда
+            if not acquire.cancel() and not acquire.cancelled() and acquire.exception() is None:
+                self._in_flight.release()
+            raise
+        finally:
+            self.metrics.backpressure_seconds_total += time.monotonic() - waiting_since
+
+    def _poll_paused(self):
+        """poll() при остановленных партициях: обслуживает группу и ребалансировки (выполняется в executor)"""
+        # Пауза ставится и на партиции, назначенные во время ожидания
+        self.consumer.pause(self.consumer.assignment())
+        msg = self.consumer.poll(0)
+        if msg is not None and not msg.error():
+            # Сообщение, полученное до паузы, будет прочитано повторно после resume
+            self.consumer.seek(TopicPartition(msg.topic(), msg.partition(), msg.offset()))
+
+    def _resume_assignment(self):
+        self.consumer.resume(self.consumer.assignment())
+
+    def _rewind(self, messages: list[Message]):
+        """
+        Возврат позиции партиций к первым необработанным сообщениям пачки (выполняется в executor).
+        Партиции могли остаться на паузе после ошибки в _acquire_slot, поэтому снимаем паузу.
+        """
+        first: Dict[tuple[str, int], int] = {}
+        for msg in messages:
+            if not msg.error():
+                first.setdefault((msg.topic(), msg.partition()), msg.offset())
+        try:
+            self._resume_assignment()
+            for (topic, partition), offset in first.items():
+                if (topic, partition) in self.partitions:
+                    self.consumer.seek(TopicPartition(topic, partition, offset))
+        except KafkaException as e:
+            logging.error(f"Failed to rewind partitions: {e}")
+
+    async def _process_in_order(
+            self,
+            state: PartitionState,
+            previous: Optional[asyncio.Task],
+            msg: Message,
+            started: Optional[asyncio.Task] = None
+    ):
+        """
+        Обработка сообщения после предыдущего из той же партиции.
+        started - уже запущенная обработка (конвейер): ее результат ожидается по порядку,
+        поэтому offset партиции продвигается только после всех предыдущих сообщений.
+        """
+        try:
+            if previous is not None:
+                await previous
+            if started is None:
+                await self.handle(msg)
+            else:
+                await started
+            state.last_offset = msg.offset()
+            state.processed += 1
+        except BaseException:
+            if started is not None:
+                started.cancel()
+            raise
+        finally:
+            self._in_flight.release()
+
+    def _on_assign(self, consumer: Consumer, partitions: list[TopicPartition]):
+        """Колбэк назначения партиций (вызывается внутри poll())"""
+        started = time.monotonic()
+        for tp in partitions:
+            self.partitions[(tp.topic, tp.partition)] = PartitionState(tp.topic, tp.partition)
+        if self._cooperative:
+            consumer.incremental_assign(partitions)
+        self.metrics.assigned_partitions += len(partitions)
+        self._record_rebalance(started, pause=False)
+        logging.info(f"Partitions assigned: {self._format_partitions(partitions)}")
+
+    def _on_revoke(self, consumer: Consumer, partitions: list[TopicPartition]):
+        """Колбэк отзыва партиций: дообработка и коммит только отзываемых партиций"""
+        started = time.monotonic()
+        offsets = self._run_on_loop(self._drain(partitions))
+        self._commit(consumer, offsets)
+        if self._cooperative:
+            consumer.incremental_unassign(partitions)
+        self.metrics.revoked_partitions += len(partitions)
+        self._record_rebalance(started, pause=True)
+        logging.info(f"Partitions revoked: {self._format_partitions(partitions)}")
+
+    def _on_lost(self, consumer: Consumer, partitions: list[TopicPartition]):
+        """Колбэк потери партиций: они уже у другого участника, коммитить нельзя"""
+        started = time.monotonic()
+        self._run_on_loop(self._drain(partitions, timeout=0))
+        if self._cooperative:
+            consumer.incremental_unassign(partitions)
+        self.metrics.lost_partitions += len(partitions)
+        self._record_rebalance(started, pause=True)
+        logging.warning(f"Partitions lost: {self._format_partitions(partitions)}")
+
+    def _run_on_loop(self, coro) -> list[TopicPartition]:
+        """Выполнение корутины в event loop из потока, в котором работает poll()"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # Колбэк вызван из самого event loop — ждать его нельзя
+            coro.close()
+            logging.error("Rebalance callback invoked from event loop thread, drain skipped")
+            return []
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(self.drain_timeout + 1)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logging.error("Drain of revoked partitions did not finish in time")
+            return []
+
+    async def _drain(
+            self,
+            partitions: list[TopicPartition],
+            timeout: Optional[float] = None
+    ) -> list[TopicPartition]:
+        """Ожидание обработки сообщений партиций и расчет offset для коммита"""
+        states = [
+            state for state in (
+                self.partitions.pop((tp.topic, tp.partition), None) for tp in partitions
+            ) if state is not None
+        ]
+        pending = [state.tail for state in states if state.tail and not state.tail.done()]
+        if pending:
+            timeout = self.drain_timeout if timeout is None else timeout
+            _, not_done = await asyncio.wait(pending, timeout=timeout)
+            if not_done:
+                # Необработанные сообщения будут перечитаны новым владельцем партиции
+                self.metrics.drain_timeouts += 1
+                logging.warning(f"Cancelling {len(not_done)} unfinished partition tasks")
+                for task in not_done:
+                    task.cancel()
+                await asyncio.gather(*not_done, return_exceptions=True)
+        return [
+            TopicPartition(state.topic, state.partition, state.last_offset + 1)
+            for state in states if state.last_offset is not None
+        ]
+
+    @staticmethod
+    def _commit(consumer: Consumer, offsets: list[TopicPartition]):
+        """Синхронный коммит offset"""
+        if not offsets:
+            return
+        try:
+            consumer.commit(offsets=offsets, asynchronous=False)
+        except KafkaException as e:
+            logging.error(f"Commit error: {e}")
+
+    def _record_rebalance(self, started: float, pause: bool):
+        """Учет длительности ребалансировки"""
+        duration = time.monotonic() - started
+        self.metrics.rebalances += 1
+        self.metrics.last_rebalance_seconds = duration
+        self.metrics.rebalance_seconds_total += duration
+        if pause:
+            self.metrics.paused_seconds_total += duration
+
+    @staticmethod
+    def _format_partitions(partitions: list[TopicPartition]) -> str:
+        return ", ".join(f"{tp.topic}[{tp.partition}]" for tp in partitions)
+
     async def handle(self, msg: Message):
         """Обработка полученного сообщения"""
+        # Этапы продюсера и время от отправки до получения
+        trace = Trace.extract(msg.headers())
+        trace.record_upstream()
+        trace.received("consume.broker_wait")
         try:
-            value = json.loads(msg.value().decode('utf-8')) if msg.value() else {}
+            with trace.span("consume.deserialize"):
+                value = json.loads(msg.value().decode('utf-8')) if msg.value() else {}
 
-            logging.info(f"Handling message: {msg.topic()} - {value}")
+            log.debug("Handling message: %s - %s", msg.topic(), value)
 
             # Пример бизнес-логики
-            if msg.topic() == "user-events":
-                await self.process_user_event(value)
+            with trace.span("consume.handler"):
+                if msg.topic() == "user-events":
+                    await self.process_user_event(value)
 
-            elif msg.topic() == "orders":
-                await self.process_order(value)
-            # self.consumer.commit()
+                elif msg.topic() == "orders":
+                    await self.process_order(value)
         except Exception as e:
             logging.error(f"Handle error: {e}")
 
@@ -68,7 +400,7 @@ class AsyncKafkaConsumer:
         user_id = data.get('user_id')
         action = data.get('action')
 
-        logging.info(f"Processing user {user_id} action: {action}")
+        log.info("Processing user %s action: %s", user_id, action)
 
         # Возвращаем ответ для отправки
         return {
@@ -83,7 +415,7 @@ class AsyncKafkaConsumer:
         order_id = data.get('order_id')
         status = data.get('status')
 
-        logging.info(f"Processing order {order_id} with status: {status}")
+        log.info("Processing order %s with status: %s", order_id, status)
 
         return {
             "order_id": order_id,
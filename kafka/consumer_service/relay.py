@@ -0,0 +1,214 @@
+"""
+Пересылка событий Kafka в RabbitMQ (для дашбордов, которые слушает consumer_service).
+
+Сообщения читаются пачками, публикуются в канал с подтверждениями (publisher confirms),
+а offset в Kafka фиксируется только после подтверждения брокером всех предыдущих
+сообщений партиции. Память ограничена relay_max_in_flight: при медленном RabbitMQ
+чтение из Kafka приостанавливается.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Optional
+
+from aio_pika import (
+    DeliveryMode,
+    Exchange,
+    ExchangeType,
+    Message as AmqpMessage,
+    RobustChannel,
+    RobustConnection,
+    connect_robust,
+)
+from aio_pika.exceptions import PublishError
+from confluent_kafka import Message, TIMESTAMP_NOT_AVAILABLE
+
+from instrumentation import Trace
+from kafka_consumer import AsyncKafkaConsumer
+from relay_config import RelayRule, RelaySettings, settings
+
+# Те же имена exchange, что объявляют сервисы RabbitMQ
+exchange_map = {
+    ExchangeType.DIRECT: "direct_exchange",
+    ExchangeType.FANOUT: "fanout_exchange",
+    ExchangeType.TOPIC: "topic_exchange"
+}
+
+
+@dataclass
+class RelayMetrics:
+    """Метрики пересылки"""
+    consumed: int = 0
+    confirmed: int = 0
+    skipped: int = 0  # Нет подходящего правила
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    # Задержка от записи в Kafka до подтверждения RabbitMQ, последние значения
+    lags_ms: deque = field(default_factory=lambda: deque(maxlen=10000))
+
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.confirmed / elapsed if elapsed else 0.0
+
+    def lag_percentile(self, q: float) -> float:
+        values = sorted(self.lags_ms)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+class KafkaRabbitMQRelay(AsyncKafkaConsumer):
+    def __init__(self, relay_settings: RelaySettings):
+        super().__init__(
+            config={
+                'bootstrap.servers': relay_settings.kafka_bootstrap_servers,
+                'group.id': relay_settings.kafka_group_id,
+                'auto.offset.reset': 'earliest',
+                # Ограничение локального буфера librdkafka (КБ на партицию)
+                'queued.max.messages.kbytes': 16384,
+            },
+            topics=relay_settings.kafka_topics,
+            max_in_flight=relay_settings.relay_max_in_flight,
+            batch_size=relay_settings.relay_batch_size,
+        )
+        self.settings = relay_settings
+        self.rules = relay_settings.relay_rules
+        self.relay_metrics = RelayMetrics()
+        self.connection: RobustConnection | None = None
+        self.channel: RobustChannel | None = None
+        self.exchanges: dict[str, Exchange] = {}
+        self._rule_cache: dict[str, Optional[RelayRule]] = {}
+
+    async def start(self):
+        """Подключение к RabbitMQ, затем подписка на Kafka"""
+        self.connection = await connect_robust(self.settings.rmq_uri, timeout=10)
+        # Канал с подтверждениями: publish() завершается после basic.ack от брокера.
+        # on_return_raises: иначе возврат mandatory-сообщения (basic.return) завершает publish()
+        # как успешный, и offset сообщения, не попавшего ни в одну очередь, был бы закоммичен
+        self.channel = await self.connection.channel(publisher_confirms=True, on_return_raises=True)
+        for rule in self.rules:
+            name = self._exchange_name(rule)
+            if name not in self.exchanges:
+                self.exchanges[name] = await self.channel.declare_exchange(
+                    name,
+                    rule.exchange_type,
+                    durable=True,
+                    auto_delete=False,
+                )
+        await super().start()
+        logging.info("Kafka -> RabbitMQ relay started")
+
+    async def stop(self):
+        """Дожидается подтверждений, коммитит offset и закрывает оба соединения"""
+        await super().stop()
+        if self.connection and not self.connection.is_closed:
+            await self.connection.close()
+        logging.info("Kafka -> RabbitMQ relay stopped")
+
+    @staticmethod
+    def _exchange_name(rule: RelayRule) -> str:
+        return rule.exchange or exchange_map[rule.exchange_type]
+
+    def _rule_for(self, topic: str) -> Optional[RelayRule]:
+        """Первое правило, подходящее топику"""
+        if topic not in self._rule_cache:
+            self._rule_cache[topic] = next(
+                (rule for rule in self.rules if fnmatchcase(topic, rule.topic)), None
+            )
+        return self._rule_cache[topic]
+
+    async def _dispatch(self, msg: Message):
+        """Публикация запускается сразу, а offset продвигается в порядке партиции после подтверждения"""
+        state = await self._acquire_partition(msg)
+        if state is None:
+            return
+        self.relay_metrics.consumed += 1
+        confirm = asyncio.create_task(self._publish(msg))
+        state.tail = asyncio.create_task(self._process_in_order(state, state.tail, msg, confirm))
+
+    async def _publish(self, msg: Message):
+        """Публикация с повторами до подтверждения брокером"""
+        rule = self._rule_for(msg.topic())
+        if rule is None:
+            self.relay_metrics.skipped += 1
+            return
+        key = msg.key().decode('utf-8', errors='replace') if msg.key() else ""
+        timestamp_type, timestamp = msg.timestamp()
+        # Трасса продюсера продолжается в RabbitMQ: consumer_service увидит этапы обоих брокеров
+        trace = Trace.extract(msg.headers())
+        trace.record_upstream()
+        trace.received("relay.broker_wait")
+        message = AmqpMessage(
+            body=msg.value() or b"",
+            content_type="application/json",
+            delivery_mode=DeliveryMode.PERSISTENT,
+            headers=trace.inject({
+                "x-kafka-topic": msg.topic(),
+                "x-kafka-partition": msg.partition(),
+                "x-kafka-offset": msg.offset(),
+                "x-kafka-key": key,
+            }),
+        )
+        routing_key = rule.routing_key.format(topic=msg.topic(), partition=msg.partition(), key=key)
+        exchange = self.exchanges[self._exchange_name(rule)]
+
+        attempt = 0
+        while True:
+            try:
+                await exchange.publish(message, routing_key=routing_key, mandatory=rule.mandatory)
+                break
+            except PublishError as e:
+                # basic.return: mandatory-сообщение не попало ни в одну очередь, ждем ее появления
+                reason = f"returned by broker: {e.message.delivery.reply_text}"
+            except Exception as e:
+                # nack или разрыв соединения
+                reason = f"{e.__class__.__name__}: {e}"
+            # Повторяем, партиция при этом не продвигается (backpressure на Kafka)
+            attempt += 1
+            self.relay_metrics.retries += 1
+            logging.warning(
+                f"Publish {msg.topic()}[{msg.partition()}]@{msg.offset()} failed (attempt {attempt}): {reason}"
+            )
+            await asyncio.sleep(min(self.settings.relay_retry_delay * attempt, 30))
+
+        self.relay_metrics.confirmed += 1
+        if timestamp_type != TIMESTAMP_NOT_AVAILABLE:
+            self.relay_metrics.lags_ms.append(time.time() * 1000 - timestamp)
+
+    async def report_metrics(self, interval: float):
+        """Периодический вывод метрик"""
+        while True:
+            await asyncio.sleep(interval)
+            metrics = self.relay_metrics
+            logging.info(
+                f"Relay: consumed={metrics.consumed} confirmed={metrics.confirmed} "
+                f"skipped={metrics.skipped} retries={metrics.retries} "
+                f"throughput={metrics.throughput():.1f} msg/s "
+                f"lag p50={metrics.lag_percentile(50):.1f} ms p99={metrics.lag_percentile(99):.1f} ms "
+                f"paused={self.metrics.paused_seconds_total:.1f} s "
+                f"backpressure={self.metrics.backpressure_seconds_total:.1f} s"
+            )
+
+
+async def main():
+    relay = KafkaRabbitMQRelay(settings)
+    await relay.start()
+    reporter = asyncio.create_task(relay.report_metrics(settings.relay_metrics_interval))
+    consuming = asyncio.create_task(relay.start_consuming())
+    try:
+        await consuming
+    finally:
+        # Цикл чтения завершается сам после текущего poll(); stop() дополнительно ждет poll()
+        # в executor, если задачу отменили (Ctrl+C), чтобы close() не шел параллельно с ним
+        relay.is_running = False
+        reporter.cancel()
+        await asyncio.gather(reporter, consuming, return_exceptions=True)
+        await relay.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
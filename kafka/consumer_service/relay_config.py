@@ -0,0 +1,53 @@
+from functools import lru_cache
+from typing import Optional
+
+from aio_pika import ExchangeType
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings
+
+
+class RelayRule(BaseModel):
+    """Правило пересылки топика Kafka в exchange RabbitMQ"""
+    topic: str  # Имя топика или шаблон fnmatch (например, "orders-*")
+    exchange_type: ExchangeType = ExchangeType.TOPIC
+    exchange: Optional[str] = None  # По умолчанию - exchange сервисов RabbitMQ для этого типа
+    routing_key: str = "{topic}"  # Шаблон: {topic}, {partition}, {key}
+    mandatory: bool = False  # True - ждать появления очереди вместо отбрасывания сообщения
+
+
+class RelaySettings(BaseSettings):
+    kafka_bootstrap_servers: str = Field(alias="KAFKA_BOOTSTRAP_SERVERS", default="kafka:9092")
+    kafka_group_id: str = Field(alias="KAFKA_RELAY_GROUP_ID", default="rabbitmq-relay")
+    kafka_topics: list[str] = Field(alias="KAFKA_RELAY_TOPICS", default=["user-events", "orders"])
+    rmq_user: str = Field(alias="RMQ_USER", default="rmq_user")
+    rmq_password: str = Field(alias="RMQ_PASSWORD", default="rmq_pass")
+    rmq_host: str = Field(alias="RMQ_HOST", default="localhost")
+    rmq_port: int = Field(alias="RMQ_PORT", default=5672)
+    # JSON-список правил, первое подходящее правило побеждает
+    relay_rules: list[RelayRule] = Field(
+        alias="RELAY_RULES",
+        default=[
+            RelayRule(topic="user-events", routing_key="events.user"),
+            RelayRule(topic="orders", routing_key="events.orders"),
+        ],
+    )
+    relay_max_in_flight: int = Field(alias="RELAY_MAX_IN_FLIGHT", default=1000)
+    relay_batch_size: int = Field(alias="RELAY_BATCH_SIZE", default=500)
+    relay_retry_delay: float = Field(alias="RELAY_RETRY_DELAY", default=1.0)
+    relay_metrics_interval: float = Field(alias="RELAY_METRICS_INTERVAL", default=10.0)
+
+    @property
+    def rmq_uri(self) -> str:
+        return (
+            f"amqp://{self.rmq_user}:{self.rmq_password}@{self.rmq_host}:{self.rmq_port}/"
+        )
+
+@lru_cache
+def get_settings() -> RelaySettings:
+    """
+    Функция для получения экземпляра настроек с использованием кэширования.
+    """
+    return RelaySettings()
+
+
+settings = get_settings()
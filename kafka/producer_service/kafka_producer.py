@@ -5,6 +5,8 @@ from typing import Any
 
 from confluent_kafka import Producer, KafkaException
 
+from instrumentation import Trace
+
 
 class AsyncKafkaProducer:
     """Класс продюссера сообщений для Kafka."""
@@ -28,21 +30,29 @@ class AsyncKafkaProducer:
                       topic: str,
                       value: Any,
                       key: str | None = None,
-                      headers: dict | None = None
+                      headers: dict | list | None = None,
+                      partition: int | None = None,
+                      trace: Trace | None = None  # Продолжение трассы входящего сообщения
     ) -> Any:
         """Асинхронная отправка сообщения"""
         if not self.producer:
             raise RuntimeError("Producer not initialized. Use async with context.")
 
+        trace = trace or Trace()
         # Сериализация данных
-        serialized_value = self._serialize_value(value)
-        serialized_key = key.encode('utf-8') if key else None
+        with trace.span("produce.serialize"):
+            serialized_value = self._serialize_value(value)
+            serialized_key = key.encode('utf-8') if key else None
+        # Этапы и время отправки передаются консьюмеру в заголовках
+        headers = trace.inject(headers)
 
+        kwargs = {} if partition is None else {'partition': partition}
         self.producer.produce(
             topic=topic,
             value=serialized_value,
             key=serialized_key,
-            headers=headers
+            headers=headers,
+            **kwargs
         )
         return
 
@@ -0,0 +1,369 @@
+"""
+In-memory заменитель брокера RabbitMQ для нагрузочных тестов без контейнера.
+
+Реализует только то подмножество AMQP, которое используют RabbitMQProducer и RabbitMQConsumer:
+- exchange типов DIRECT / FANOUT / TOPIC
+- именованные и серверные (amq.gen-...) очереди, exclusive и auto_delete
+- reply_to / correlation_id передаются как есть
+- TTL сообщений (expiration) и очередей (x-message-ttl)
+- prefetch_count через channel.set_qos
+- message.process() с ack / reject как в aio_pika
+- возврат mandatory-сообщений без очереди (stats["returned"]), исключение при on_return_raises=True
+
+Подключение вместо реального брокера:
+    broker = InMemoryBroker()
+    publisher.connect_robust = broker.connect_robust
+"""
+import asyncio
+import logging
+import secrets
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional
+
+from aio_pika import ExchangeType, Message
+
+
+class InMemoryBrokerError(Exception):
+    """Ошибка, на которую реальный брокер ответил бы закрытием канала"""
+
+
+class UnroutableMessageError(InMemoryBrokerError):
+    """mandatory-сообщение не попало ни в одну очередь (basic.return)"""
+
+
+@lru_cache(maxsize=4096)
+def topic_matches(binding_key: str, routing_key: str) -> bool:
+    """Проверка routing_key на соответствие ключу привязки TOPIC ('*' - одно слово, '#' - ноль и более)"""
+    return _match_words(tuple(binding_key.split(".")), tuple(routing_key.split(".")))
+
+
+def _match_words(pattern: tuple[str, ...], words: tuple[str, ...]) -> bool:
+    if not pattern:
+        return not words
+    head, rest = pattern[0], pattern[1:]
+    if head == "#":
+        return any(_match_words(rest, words[i:]) for i in range(len(words) + 1))
+    if not words:
+        return False
+    return (head == "*" or head == words[0]) and _match_words(rest, words[1:])
+
+
+class InMemoryIncomingMessage:
+    """Полученное сообщение с интерфейсом AbstractIncomingMessage"""
+
+    def __init__(
+            self,
+            message: Message,
+            exchange: str,
+            routing_key: str,
+            queue: "QueueState",
+            on_settle: Optional[Callable[[], None]] = None,
+    ):
+        self.message = message
+        self.body = message.body
+        self.headers = message.headers
+        self.content_type = message.content_type
+        self.correlation_id = message.correlation_id
+        self.reply_to = message.reply_to
+        self.expiration = message.expiration
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.redelivered = False
+        self.processed = False
+        self._queue = queue
+        self._on_settle = on_settle
+
+    def _settle(self):
+        if self.processed:
+            raise InMemoryBrokerError("Message already processed")
+        self.processed = True
+        if self._on_settle:
+            self._on_settle()
+
+    async def ack(self, multiple: bool = False) -> None:
+        self._settle()
+
+    async def reject(self, requeue: bool = False) -> None:
+        self._settle()
+        if requeue:
+            self._queue.put(self.message, self.exchange, self.routing_key, redelivered=True)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True) -> None:
+        await self.reject(requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, ignore_processed: bool = False):
+        """Аналог aio_pika: ack при успехе, reject при исключении (исключение пробрасывается)"""
+        try:
+            yield self
+        except BaseException:
+            if not self.processed:
+                await self.reject(requeue=requeue)
+            raise
+        if not self.processed:
+            await self.ack()
+
+
+class QueueState:
+    """Состояние очереди на стороне брокера"""
+
+    def __init__(
+            self,
+            name: str,
+            durable: bool,
+            exclusive: bool,
+            auto_delete: bool,
+            arguments: dict[str, Any],
+            owner: "InMemoryConnection",
+    ):
+        self.name = name
+        self.durable = durable
+        self.exclusive = exclusive
+        self.auto_delete = auto_delete
+        self.arguments = arguments
+        self.owner = owner
+        self.ttl_ms: Optional[int] = arguments.get("x-message-ttl")
+        self.deleted = False
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.consumers: dict[str, asyncio.Task] = {}
+
+    def put(self, message: Message, exchange: str, routing_key: str, redelivered: bool = False):
+        """Помещение сообщения в очередь с учетом TTL сообщения и очереди"""
+        ttl_ms = self.ttl_ms
+        if message.properties.expiration is not None:
+            message_ttl = int(message.properties.expiration)
+            ttl_ms = message_ttl if ttl_ms is None else min(ttl_ms, message_ttl)
+        expires_at = time.monotonic() + ttl_ms / 1000 if ttl_ms is not None else None
+        self.messages.put_nowait((message, exchange, routing_key, expires_at, redelivered))
+
+
+class InMemoryQueue:
+    """Очередь, объявленная в конкретном канале (интерфейс AbstractQueue)"""
+
+    def __init__(self, state: QueueState, channel: "InMemoryChannel"):
+        self.state = state
+        self.channel = channel
+        self.broker = channel.broker
+        self.name = state.name
+
+    async def bind(self, exchange: "InMemoryExchange | str", routing_key: Optional[str] = None, **kwargs) -> None:
+        exchange = self.broker.get_exchange(exchange)
+        exchange.bindings.add((self.state, routing_key or ""))
+
+    async def unbind(self, exchange: "InMemoryExchange | str", routing_key: Optional[str] = None, **kwargs) -> None:
+        exchange = self.broker.get_exchange(exchange)
+        exchange.bindings.discard((self.state, routing_key or ""))
+
+    async def consume(
+            self,
+            callback: Callable[[InMemoryIncomingMessage], Awaitable[Any]],
+            no_ack: bool = False,
+            consumer_tag: Optional[str] = None,
+            **kwargs,
+    ) -> str:
+        if self.state.deleted:
+            raise InMemoryBrokerError(f"NOT_FOUND: queue '{self.name}'")
+        consumer_tag = consumer_tag or f"ctag-{secrets.token_hex(8)}"
+        self.state.consumers[consumer_tag] = asyncio.create_task(self._deliver(callback, no_ack))
+        self.channel.consumers.append((self, consumer_tag))
+        return consumer_tag
+
+    async def cancel(self, consumer_tag: str, **kwargs) -> None:
+        task = self.state.consumers.pop(consumer_tag, None)
+        if task:
+            task.cancel()
+        # auto_delete очередь удаляется после отписки последнего консьюмера
+        if self.state.auto_delete and not self.state.consumers:
+            self.broker.delete_queue(self.state)
+
+    async def _deliver(self, callback: Callable, no_ack: bool):
+        """Цикл доставки сообщений одному консьюмеру с учетом prefetch"""
+        prefetch = self.channel.prefetch_count
+        limit = asyncio.Semaphore(prefetch) if prefetch and not no_ack else None
+        while True:
+            if limit:
+                await limit.acquire()
+            message, exchange, routing_key, expires_at, redelivered = await self.state.messages.get()
+            if expires_at is not None and expires_at <= time.monotonic():
+                self.broker.stats["expired"] += 1
+                if limit:
+                    limit.release()
+                continue
+            incoming = InMemoryIncomingMessage(
+                message, exchange, routing_key, self.state, on_settle=limit.release if limit else None
+            )
+            incoming.redelivered = redelivered
+            if no_ack:
+                incoming.processed = True
+            self.broker.stats["delivered"] += 1
+            self.channel.spawn(self._run_callback(callback, incoming))
+
+    @staticmethod
+    async def _run_callback(callback: Callable, message: InMemoryIncomingMessage):
+        try:
+            await callback(message)
+        except Exception:
+            logging.exception(f"Consumer callback failed for {message.correlation_id}")
+
+
+class ExchangeState:
+    """Состояние exchange на стороне брокера"""
+
+    def __init__(self, name: str, exchange_type: ExchangeType, durable: bool, auto_delete: bool):
+        self.name = name
+        self.type = exchange_type
+        self.durable = durable
+        self.auto_delete = auto_delete
+        self.bindings: set[tuple[QueueState, str]] = set()
+
+    def route(self, routing_key: str) -> set[QueueState]:
+        if self.type == ExchangeType.FANOUT:
+            return {queue for queue, _ in self.bindings}
+        if self.type == ExchangeType.TOPIC:
+            return {queue for queue, key in self.bindings if topic_matches(key, routing_key)}
+        return {queue for queue, key in self.bindings if key == routing_key}
+
+
+class InMemoryExchange:
+    """Exchange, объявленный в конкретном канале (интерфейс AbstractExchange)"""
+
+    def __init__(self, state: ExchangeState, channel: "InMemoryChannel"):
+        self.state = state
+        self.channel = channel
+        self.broker = channel.broker
+        self.name = state.name
+
+    async def publish(self, message: Message, routing_key: str, mandatory: bool = True, **kwargs) -> None:
+        queues = self.state.route(routing_key)
+        if not queues:
+            if mandatory:
+                # Как в aio_pika: basic.return завершает publish() без ошибки,
+                # исключение только в канале с on_return_raises=True
+                self.broker.stats["returned"] += 1
+                if self.channel.on_return_raises:
+                    raise UnroutableMessageError(f"NO_ROUTE: {self.name} -> {routing_key}")
+            return
+        for queue in queues:
+            queue.put(message, self.name, routing_key)
+
+
+class InMemoryChannel:
+    def __init__(self, connection: "InMemoryConnection", on_return_raises: bool = False):
+        self.connection = connection
+        self.broker = connection.broker
+        self.on_return_raises = on_return_raises
+        self.is_closed = False
+        self.prefetch_count = 0
+        self.consumers: list[tuple[InMemoryQueue, str]] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def spawn(self, coro) -> None:
+        """Запуск обработчика сообщения отдельной задачей, как это делает aio_pika"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs) -> None:
+        self.prefetch_count = prefetch_count
+
+    async def declare_exchange(
+            self,
+            name: str,
+            type: ExchangeType = ExchangeType.DIRECT,
+            durable: bool = False,
+            auto_delete: bool = False,
+            **kwargs,
+    ) -> InMemoryExchange:
+        state = self.broker.exchanges.get(name)
+        if state is None:
+            state = self.broker.exchanges[name] = ExchangeState(name, type, durable, auto_delete)
+        elif state.type != type:
+            raise InMemoryBrokerError(f"PRECONDITION_FAILED: exchange '{name}' is {state.type}, not {type}")
+        return InMemoryExchange(state, self)
+
+    async def declare_queue(
+            self,
+            name: Optional[str] = None,
+            *,
+            durable: bool = False,
+            exclusive: bool = False,
+            auto_delete: bool = False,
+            arguments: Optional[dict] = None,
+            **kwargs,
+    ) -> InMemoryQueue:
+        name = name or f"amq.gen-{secrets.token_urlsafe(16)}"
+        state = self.broker.queues.get(name)
+        if state is None:
+            state = QueueState(name, durable, exclusive, auto_delete, arguments or {}, self.connection)
+            self.broker.queues[name] = state
+        elif state.exclusive and state.owner is not self.connection:
+            raise InMemoryBrokerError(f"RESOURCE_LOCKED: queue '{name}' is exclusive")
+        return InMemoryQueue(state, self)
+
+    async def close(self) -> None:
+        if self.is_closed:
+            return
+        self.is_closed = True
+        for queue, consumer_tag in self.consumers:
+            await queue.cancel(consumer_tag)
+        self.consumers.clear()
+
+
+class InMemoryConnection:
+    def __init__(self, broker: "InMemoryBroker"):
+        self.broker = broker
+        self.is_closed = False
+        self.channels: list[InMemoryChannel] = []
+
+    async def channel(self, on_return_raises: bool = False, **kwargs) -> InMemoryChannel:
+        channel = InMemoryChannel(self, on_return_raises)
+        self.channels.append(channel)
+        return channel
+
+    async def close(self) -> None:
+        if self.is_closed:
+            return
+        self.is_closed = True
+        for channel in self.channels:
+            await channel.close()
+        # Exclusive очереди удаляются вместе с соединением-владельцем
+        for queue in list(self.broker.queues.values()):
+            if queue.exclusive and queue.owner is self:
+                self.broker.delete_queue(queue)
+
+
+class InMemoryBroker:
+    """Брокер в памяти процесса. Соединения создаются через connect_robust / connect."""
+
+    def __init__(self):
+        self.exchanges: dict[str, ExchangeState] = {}
+        self.queues: dict[str, QueueState] = {}
+        self.stats: Counter = Counter()
+
+    async def connect_robust(self, url: Optional[str] = None, **kwargs) -> InMemoryConnection:
+        self.stats["connections"] += 1
+        return InMemoryConnection(self)
+
+    connect = connect_robust
+
+    def get_exchange(self, exchange: "InMemoryExchange | str") -> ExchangeState:
+        if isinstance(exchange, InMemoryExchange):
+            return exchange.state
+        try:
+            return self.exchanges[exchange]
+        except KeyError:
+            raise InMemoryBrokerError(f"NOT_FOUND: exchange '{exchange}'") from None
+
+    def delete_queue(self, queue: QueueState) -> None:
+        if queue.deleted:
+            return
+        queue.deleted = True
+        self.queues.pop(queue.name, None)
+        for exchange in self.exchanges.values():
+            exchange.bindings = {(q, key) for q, key in exchange.bindings if q is not queue}
+        for task in queue.consumers.values():
+            task.cancel()
+        queue.consumers.clear()
@@ -0,0 +1,177 @@
+"""
+Нагрузочный тест RPC RabbitMQProducer <-> RabbitMQConsumer.
+
+По умолчанию брокер заменяется InMemoryBroker, контейнер RabbitMQ не нужен.
+С флагом --real используется брокер из настроек config.py (RMQ_HOST, RMQ_PORT, ...).
+
+Запуск:
+    python rpc_benchmark.py --clients 50 --requests 200
+    python rpc_benchmark.py --exchange-types direct,topic --real
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from aio_pika import ExchangeType
+
+# Настройки consumer_service - надмножество настроек publisher_service,
+# поэтому его каталог идет первым и модуль config берется оттуда
+sys.path.append(str(Path(__file__).resolve().parents[1] / "consumer_service"))
+sys.path.append(str(Path(__file__).resolve().parents[1] / "publisher_service"))
+
+import consumer  # noqa: E402
+import publisher  # noqa: E402
+from consumer import RabbitMQConsumer  # noqa: E402
+from publisher import RabbitMQProducer  # noqa: E402
+from in_memory_broker import InMemoryBroker  # noqa: E402
+
+# Ключ привязки очереди запросов и ключ, с которым клиенты публикуют запросы
+ROUTING_KEYS = {
+    ExchangeType.DIRECT: ("rpc", "rpc"),
+    ExchangeType.FANOUT: ("", ""),
+    ExchangeType.TOPIC: ("rpc.*", "rpc.bench"),
+}
+
+
+class NullWebSocket:
+    """Заглушка WebSocket дашборда: RabbitMQConsumer.handle пересылает в него каждое сообщение"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_text(self, data: str) -> None:
+        self.sent += 1
+
+
+@dataclass
+class ExchangeResult:
+    exchange_type: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+    p999_ms: float
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def run_client(
+        exchange_type: ExchangeType,
+        routing_key: str,
+        requests: int,
+        timeout: float,
+        latencies: list[float],
+) -> int:
+    """Один RPC-клиент: последовательные запросы через собственный RabbitMQProducer"""
+    errors = 0
+    async with RabbitMQProducer(exchange_type) as client:
+        for i in range(requests):
+            started = time.perf_counter()
+            try:
+                response = await client.publish({"request": i}, routing_key=routing_key, timeout=timeout)
+            except TimeoutError:
+                response = None
+            if response is None:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+    return errors
+
+
+async def run_exchange(
+        exchange_type: ExchangeType,
+        clients: int,
+        requests: int,
+        consumers: int,
+        timeout: float,
+) -> ExchangeResult:
+    """Прогон N клиентов против M консьюмеров для одного типа exchange"""
+    binding_key, routing_key = ROUTING_KEYS[exchange_type]
+    websocket = NullWebSocket()
+    services = [RabbitMQConsumer(exchange_type, binding_key) for _ in range(consumers)]
+    for service in services:
+        await service.connect()
+    consuming = [asyncio.create_task(service.start_consuming(websocket)) for service in services]
+
+    latencies: list[float] = []
+    started = time.perf_counter()
+    try:
+        errors = await asyncio.gather(*(
+            run_client(exchange_type, routing_key, requests, timeout, latencies) for _ in range(clients)
+        ))
+    finally:
+        seconds = time.perf_counter() - started
+        for task in consuming:
+            task.cancel()
+        await asyncio.gather(*consuming, return_exceptions=True)
+        for service in services:
+            await service.stop()
+
+    latencies.sort()
+    return ExchangeResult(
+        exchange_type=exchange_type.value,
+        requests=clients * requests,
+        errors=sum(errors),
+        seconds=round(seconds, 3),
+        throughput=round(len(latencies) / seconds, 1),
+        p50_ms=round(percentile(latencies, 50), 3),
+        p99_ms=round(percentile(latencies, 99), 3),
+        p999_ms=round(percentile(latencies, 99.9), 3),
+    )
+
+
+def print_results(results: list[ExchangeResult]):
+    header = f"{'exchange':<10} {'requests':>9} {'errors':>7} {'rps':>10} {'p50 ms':>9} {'p99 ms':>9} {'p999 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r.exchange_type:<10} {r.requests:>9} {r.errors:>7} {r.throughput:>10} "
+            f"{r.p50_ms:>9} {r.p99_ms:>9} {r.p999_ms:>9}"
+        )
+
+
+async def main(args: argparse.Namespace):
+    if not args.real:
+        broker = InMemoryBroker()
+        # Сервисы импортируют connect_robust в свое пространство имен - подменяем его там
+        consumer.connect_robust = broker.connect_robust
+        publisher.connect_robust = broker.connect_robust
+
+    results = []
+    for exchange_type in args.exchange_types:
+        logging.info(f"Running {exchange_type.value}: {args.clients} clients x {args.requests} requests")
+        results.append(await run_exchange(
+            exchange_type, args.clients, args.requests, args.consumers, args.timeout
+        ))
+    print_results(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RabbitMQ RPC latency benchmark")
+    parser.add_argument("--clients", type=int, default=20, help="Количество параллельных RPC-клиентов")
+    parser.add_argument("--requests", type=int, default=100, help="Запросов на клиента")
+    parser.add_argument("--consumers", type=int, default=1, help="Количество экземпляров RabbitMQConsumer")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Таймаут ответа, с")
+    parser.add_argument(
+        "--exchange-types",
+        type=lambda v: [ExchangeType(item) for item in v.split(",") if item],
+        default=[ExchangeType.DIRECT, ExchangeType.FANOUT, ExchangeType.TOPIC],
+    )
+    parser.add_argument("--real", action="store_true", help="Использовать реальный брокер из config.py")
+
+    # Сервисы логируют запросы на уровне INFO (каждый LOG_SAMPLE_EVERY-й), это исказит замер
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
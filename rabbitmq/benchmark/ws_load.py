@@ -0,0 +1,311 @@
+"""
+Генератор нагрузки на путь WebSocket -> publisher_service -> RabbitMQ -> consumer_service -> WebSocket.
+
+Открывает дашборды на /ws consumer_service (:8001) и клиентов на /ws publisher_service (:8002),
+шлет кадры с заданной частотой и сопоставляет каждый кадр:
+- с ответом publisher_service (ответы на одном соединении приходят по порядку отправки)
+- с пушем consumer_service на любой из дашбордов (по идентификатору внутри кадра)
+
+Запуск:
+    python ws_load.py --publishers 1000 --dashboards 50 --rate 2 --duration 60 \
+        --exchange-type direct --routing-key orders --server-pids 1234,5678
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlencode
+
+import websockets
+
+FRAME_ID = re.compile(r"lg-\d+-\d+")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+@dataclass
+class LoadStats:
+    """Счетчики и замеры нагрузочного прогона"""
+    connect_ms: list[float] = field(default_factory=list)
+    rtt_ms: list[float] = field(default_factory=list)
+    push_ms: list[float] = field(default_factory=list)
+    connect_errors: int = 0
+    disconnects: int = 0
+    sent: int = 0
+    replies: int = 0
+    error_replies: int = 0  # publisher_service ответил null (publish завершился ошибкой)
+    pushes: int = 0
+    duplicate_pushes: int = 0
+    dropped_replies: int = 0
+    dropped_pushes: int = 0
+    # Время отправки кадров, для которых еще не было пуша от consumer_service
+    awaiting_push: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class Sample:
+    """Срез за интервал: клиентские счетчики и ресурсы серверов"""
+    at: float
+    sent: int
+    replies: int
+    pushes: int
+    servers: dict[int, tuple[float, float]]  # pid -> (cpu %, rss MB)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def ws_url(base: str, exchange_type: str, routing_key: str) -> str:
+    return f"{base.rstrip('/')}/ws?{urlencode({'exchange_type': exchange_type, 'routing_key': routing_key})}"
+
+
+def read_process(pid: int) -> Optional[tuple[float, float]]:
+    """Суммарное процессорное время (с) и RSS (МБ) процесса из /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Имя процесса в скобках может содержать пробелы, поля считаем после ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return None
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return cpu_seconds, rss_kb / 1024
+
+
+async def dashboard(url: str, stats: LoadStats, ready: asyncio.Semaphore, connect_limit: asyncio.Semaphore):
+    """Дашборд: слушает пуши consumer_service"""
+    async with connect_limit:
+        started = time.perf_counter()
+        try:
+            ws = await websockets.connect(url, max_queue=None)
+        except Exception as e:
+            stats.connect_errors += 1
+            logging.debug(f"Dashboard connect failed: {e}")
+            ready.release()
+            return
+        stats.connect_ms.append((time.perf_counter() - started) * 1000)
+    ready.release()
+    try:
+        async for frame in ws:
+            received = time.perf_counter()
+            for frame_id in FRAME_ID.findall(frame if isinstance(frame, str) else frame.decode()):
+                sent = stats.awaiting_push.pop(frame_id, None)
+                if sent is None:
+                    # Для FANOUT один кадр доставляется каждой привязанной очереди
+                    stats.duplicate_pushes += 1
+                    continue
+                stats.pushes += 1
+                stats.push_ms.append((received - sent) * 1000)
+    except websockets.ConnectionClosed:
+        stats.disconnects += 1
+    finally:
+        await ws.close()
+
+
+async def publisher_client(
+        index: int,
+        url: str,
+        rate: float,
+        stop_at: float,
+        grace: float,
+        stats: LoadStats,
+        connect_limit: asyncio.Semaphore,
+):
+    """Клиент publisher_service: шлет кадры с частотой rate и ждет ответы"""
+    async with connect_limit:
+        started = time.perf_counter()
+        try:
+            ws = await websockets.connect(url, max_queue=None)
+        except Exception as e:
+            stats.connect_errors += 1
+            logging.debug(f"Publisher connect failed: {e}")
+            return
+        stats.connect_ms.append((time.perf_counter() - started) * 1000)
+
+    in_flight: deque[float] = deque()
+
+    async def read_replies():
+        async for reply in ws:
+            received = time.perf_counter()
+            sent = in_flight.popleft()
+            stats.replies += 1
+            stats.rtt_ms.append((received - sent) * 1000)
+            if reply == "null":
+                stats.error_replies += 1
+
+    reader = asyncio.create_task(read_replies())
+    try:
+        first = time.perf_counter()
+        seq = 0
+        while time.perf_counter() < stop_at and not reader.done():
+            # Расписание от момента старта, чтобы задержки отправки не снижали частоту
+            delay = first + seq / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            frame_id = f"lg-{index}-{seq}"
+            sent = time.perf_counter()
+            in_flight.append(sent)
+            stats.awaiting_push[frame_id] = sent
+            await ws.send(frame_id)
+            stats.sent += 1
+            seq += 1
+        # Ждем ответы на уже отправленные кадры
+        deadline = time.perf_counter() + grace
+        while in_flight and not reader.done() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+    except websockets.ConnectionClosed:
+        stats.disconnects += 1
+    finally:
+        stats.dropped_replies += len(in_flight)
+        reader.cancel()
+        await ws.close()
+
+
+async def sample_loop(
+        stats: LoadStats,
+        pids: list[int],
+        interval: float,
+        samples: list[Sample],
+        stop: asyncio.Event,
+):
+    """Периодический срез клиентских счетчиков и ресурсов серверов"""
+    previous = {pid: read_process(pid) for pid in pids}
+    previous_at = time.perf_counter()
+    started = previous_at
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        now = time.perf_counter()
+        servers = {}
+        for pid in pids:
+            current = read_process(pid)
+            if current and previous.get(pid):
+                cpu = (current[0] - previous[pid][0]) / (now - previous_at) * 100
+                servers[pid] = (round(cpu, 1), round(current[1], 1))
+            previous[pid] = current
+        previous_at = now
+        samples.append(Sample(round(now - started, 1), stats.sent, stats.replies, stats.pushes, servers))
+
+
+def print_report(stats: LoadStats, samples: list[Sample], pids: list[int]):
+    print("\nTimeline")
+    header = f"{'t, s':>7} {'sent/s':>9} {'reply/s':>9} {'push/s':>9}" + "".join(
+        f" {f'cpu% {pid}':>12} {f'rss MB {pid}':>13}" for pid in pids
+    )
+    print(header)
+    print("-" * len(header))
+    previous = Sample(0, 0, 0, 0, {})
+    for sample in samples:
+        elapsed = max(sample.at - previous.at, 1e-9)
+        line = (
+            f"{sample.at:>7} {round((sample.sent - previous.sent) / elapsed):>9} "
+            f"{round((sample.replies - previous.replies) / elapsed):>9} "
+            f"{round((sample.pushes - previous.pushes) / elapsed):>9}"
+        )
+        for pid in pids:
+            cpu, rss = sample.servers.get(pid, ("-", "-"))
+            line += f" {cpu:>12} {rss:>13}"
+        print(line)
+        previous = sample
+
+    print("\nSummary")
+    print(
+        f"connections: ok={len(stats.connect_ms)} failed={stats.connect_errors} "
+        f"closed by server={stats.disconnects}"
+    )
+    print(
+        f"frames: sent={stats.sent} replies={stats.replies} error replies={stats.error_replies} "
+        f"pushes={stats.pushes} duplicate pushes={stats.duplicate_pushes}"
+    )
+    print(f"dropped: replies={stats.dropped_replies} pushes={stats.dropped_pushes}")
+    print(f"{'metric':<16} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'p999 ms':>9} {'max ms':>9}")
+    for name, values in (
+            ("connect", stats.connect_ms),
+            ("reply rtt", stats.rtt_ms),
+            ("push latency", stats.push_ms),
+    ):
+        values.sort()
+        print(
+            f"{name:<16} {percentile(values, 50):>9.2f} {percentile(values, 90):>9.2f} "
+            f"{percentile(values, 99):>9.2f} {percentile(values, 99.9):>9.2f} "
+            f"{(values[-1] if values else 0.0):>9.2f}"
+        )
+
+
+async def main(args: argparse.Namespace):
+    stats = LoadStats()
+    connect_limit = asyncio.Semaphore(args.connect_concurrency)
+    dashboard_url = ws_url(args.consumer_url, args.exchange_type, args.binding_key or args.routing_key)
+    publisher_url = ws_url(args.publisher_url, args.exchange_type, args.routing_key) + f"&timeout={args.timeout}"
+
+    samples: list[Sample] = []
+    stop_sampling = asyncio.Event()
+    sampler = asyncio.create_task(sample_loop(stats, args.server_pids, args.interval, samples, stop_sampling))
+
+    # Дашборды подключаются первыми: очередь consumer_service создается при подключении
+    ready = asyncio.Semaphore(0)
+    dashboards = [
+        asyncio.create_task(dashboard(dashboard_url, stats, ready, connect_limit))
+        for _ in range(args.dashboards)
+    ]
+    for _ in range(args.dashboards):
+        await ready.acquire()
+    logging.info(f"{args.dashboards} dashboards connected")
+
+    stop_at = time.perf_counter() + args.duration
+    await asyncio.gather(*(
+        publisher_client(i, publisher_url, args.rate, stop_at, args.grace, stats, connect_limit)
+        for i in range(args.publishers)
+    ))
+
+    # Даем дошедшим до брокера сообщениям добраться до дашбордов
+    deadline = time.perf_counter() + args.grace
+    while stats.awaiting_push and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    stats.dropped_pushes = len(stats.awaiting_push)
+
+    for task in dashboards:
+        task.cancel()
+    await asyncio.gather(*dashboards, return_exceptions=True)
+    stop_sampling.set()
+    await sampler
+    print_report(stats, samples, args.server_pids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WebSocket publisher->broker->consumer load generator")
+    parser.add_argument("--publisher-url", default="ws://localhost:8002")
+    parser.add_argument("--consumer-url", default="ws://localhost:8001")
+    parser.add_argument("--exchange-type", choices=["direct", "fanout", "topic"], default="direct")
+    parser.add_argument("--routing-key", default="", help="Ключ, с которым publisher_service публикует кадры")
+    parser.add_argument(
+        "--binding-key", default=None,
+        help="Ключ привязки очереди consumer_service (для TOPIC - шаблон), по умолчанию --routing-key"
+    )
+    parser.add_argument("--publishers", type=int, default=100, help="Клиентов publisher_service")
+    parser.add_argument("--dashboards", type=int, default=10, help="Дашбордов consumer_service")
+    parser.add_argument("--rate", type=float, default=1.0, help="Кадров в секунду на клиента")
+    parser.add_argument("--duration", type=float, default=30.0, help="Длительность отправки, с")
+    parser.add_argument("--timeout", type=int, default=5, help="Таймаут RPC в publisher_service, с")
+    parser.add_argument("--grace", type=float, default=10.0, help="Ожидание ответов после отправки, с")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="Одновременных рукопожатий")
+    parser.add_argument(
+        "--server-pids", type=lambda v: [int(pid) for pid in v.split(",") if pid], default=[],
+        help="PID процессов сервисов для замера CPU и RSS"
+    )
+    parser.add_argument("--interval", type=float, default=1.0, help="Интервал среза, с")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
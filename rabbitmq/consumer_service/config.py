@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -14,6 +15,10 @@ class MessageBrokerSettings(BaseSettings):
     )
     rmq_reconnect_delay: int = Field(alias="RMQ_RECONNECT_DELAY", default=5)
     rmq_max_reconnect_attempts: int = Field(alias="RMQ_MAX_RECONNECT_ATTEMPTS", default=10)
+    # В лог горячего пути пишется каждое N-е сообщение (уровень логирования учитывается)
+    log_sample_every: int = Field(alias="LOG_SAMPLE_EVERY", default=100)
+    # Включает эндпоинты /debug/* (профилировщик, тайминги) с заголовком X-Debug-Token; без него - 404
+    debug_token: Optional[str] = Field(alias="DEBUG_TOKEN", default=None)
 
     @property
     def rmq_uri(self) -> str:
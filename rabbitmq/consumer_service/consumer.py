@@ -17,6 +17,12 @@ from aio_pika import (
 from aio_pika.abc import AbstractIncomingMessage
 
 from config import settings
+from instrumentation import SampledLogger, Trace
+
+log = SampledLogger(logging.getLogger(__name__), settings.log_sample_every)
+
+# Заголовок, которым relay (kafka/consumer_service/relay.py) помечает события из Kafka
+RELAY_TOPIC_HEADER = "x-kafka-topic"
 
 exchange_map = {
     ExchangeType.DIRECT: "direct_exchange",
@@ -79,15 +85,19 @@ class RabbitMQConsumer:
                 await asyncio.sleep(settings.rmq_reconnect_delay * attempt)  # Exponential backoff
 
     async def _send_response(
-        self, reply_to_rk: str, corr_id: str, data: dict = None
+        self, reply_to_rk: str, corr_id: str, data: dict = None, trace: Optional[Trace] = None
     ) -> None:
         """Отправляет ответ во ВРЕМЕННУЮ очередь клиента."""
         try:
+            trace = trace or Trace()
+            with trace.span("reply.serialize"):
+                body = json.dumps(data).encode()
             response_message = Message(
-                body=json.dumps(data).encode(),
+                body=body,
                 correlation_id=corr_id,
                 content_type="application/json",
-                expiration=10000  # Время жизни ответа (10 секунд)
+                expiration=10000,  # Время жизни ответа (10 секунд)
+                headers=trace.inject()  # Этапы обработки возвращаются клиенту вместе с ответом
             )
             await self.exchange.publish(response_message, routing_key=reply_to_rk)
         except Exception as e:
@@ -97,7 +107,7 @@ class RabbitMQConsumer:
         """Обработка сообщения"""
         try:
             request_data = json.loads(message.body.decode())
-            logging.info(f"Processing request: {request_data}")
+            log.debug("Processing request: %s", request_data)
             # Здесь должна быть ваша бизнес-логика обработки запроса
             return {"response": "ok", "processed": True}  # Заглушка успешной обработки
         except json.JSONDecodeError:
@@ -114,18 +124,29 @@ class RabbitMQConsumer:
                 reply_to = message.reply_to
                 # Получение ID корреляции для сопоставления запроса-ответа
                 correlation_id = message.correlation_id
-                # Получение ключа маршрутизации сообщения
+                # Этапы, измеренные отправителем, и время ожидания в брокере
+                trace = Trace.extract(message.headers)
+                trace.record_upstream()
+                trace.received("consume.broker_wait")
                 if not reply_to:
+                    # События, пересланные из Kafka (relay), только показываются на дашборде.
+                    # Остальное без reply_to - например, собственные RPC-ответы, вернувшиеся через FANOUT
+                    if (message.headers or {}).get(RELAY_TOPIC_HEADER) is not None:
+                        with trace.span("consume.ws_send"):
+                            await websocket.send_text(message.body.__str__())
+                        return
                     logging.error("No 'reply_to' in message. Cannot send response.")
                     return
                 # Обработка сообщения (вызов метода обработки)
-                result = await self._process_message(message)
+                with trace.span("consume.handler"):
+                    result = await self._process_message(message)
                 # Если очередь слушает по паттерну "response.*" отправляем туда
                 if self.exchange_type == ExchangeType.TOPIC:
                     reply_to = f"response.{reply_to}"
-                await websocket.send_text(message.body.__str__())
-                await self._send_response(reply_to, correlation_id, result)
-                logging.info(f"Request {correlation_id} processed successfully")
+                with trace.span("consume.ws_send"):
+                    await websocket.send_text(message.body.__str__())
+                await self._send_response(reply_to, correlation_id, result, trace)
+                log.info("Request %s processed successfully", correlation_id)
             except Exception as e:
                 logging.exception("Failed to process RPC request")
                 if reply_to and correlation_id:
@@ -0,0 +1,63 @@
+import secrets
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from config import settings
+from instrumentation import profiler, spans
+
+
+async def check_debug_token(x_debug_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Эндпоинты включаются только заданным DEBUG_TOKEN и требуют заголовок X-Debug-Token.
+    Без токена отвечаем 404, как будто эндпоинтов нет.
+    """
+    if not settings.debug_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_debug_token or "", settings.debug_token):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+
+debug_router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(check_debug_token)])
+
+
+@debug_router.post("/profiler/start")
+async def start_profiler(
+        interval_ms: float = Query(default=5.0, ge=1.0, le=1000.0),  # Период сэмплирования
+        duration: Optional[float] = Query(default=None, gt=0, le=3600),  # Автоостановка через N секунд
+):
+    """Включение сэмплирующего профилировщика без перезапуска сервиса"""
+    if not profiler.start(interval_ms / 1000, duration):
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return profiler.status()
+
+
+@debug_router.post("/profiler/stop")
+async def stop_profiler(limit: int = Query(default=30, ge=1)):
+    """Остановка профилировщика и самые частые функции"""
+    profiler.stop()
+    return {**profiler.status(), "top": profiler.top(limit)}
+
+
+@debug_router.get("/profiler")
+async def profiler_report(
+        limit: int = Query(default=30, ge=1),
+        format: Literal["json", "collapsed"] = "json",
+):
+    """Текущие результаты; format=collapsed - стеки для flamegraph.pl/speedscope"""
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return {**profiler.status(), "top": profiler.top(limit)}
+
+
+@debug_router.get("/spans")
+async def span_stats():
+    """Длительности этапов обработки сообщений (мс)"""
+    return spans.snapshot()
+
+
+@debug_router.delete("/spans")
+async def reset_span_stats():
+    spans.reset()
+    return {"status": "reset"}
@@ -1,12 +1,14 @@
 import uvicorn
 from fastapi import FastAPI
 
+from debug import debug_router
 from websocket import websocket_router
 
 app = FastAPI(
     docs_url="/docs"
 )
 app.include_router(websocket_router)
+app.include_router(debug_router)
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
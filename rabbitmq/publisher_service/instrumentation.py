@@ -0,0 +1,325 @@
+"""
+Инструментирование горячего пути сервисов обмена сообщениями.
+
+- SampledLogger: ленивое логирование каждого N-го вызова (аргументы форматируются только при записи)
+- Trace: длительности этапов обработки (спаны), передаваемые в заголовках AMQP/Kafka
+  publish -> consume -> reply, и агрегированная статистика по ним в SpanRegistry
+- SamplingProfiler: сэмплирующий профилировщик, включаемый без перезапуска сервиса
+
+Модуль без внешних зависимостей. Каждый сервис собирается в отдельный образ и импортирует
+модули плоско, поэтому одинаковая копия файла лежит в каталоге каждого сервиса.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Mapping, Optional
+
+TRACE_ID_HEADER = "x-trace-id"
+TRACE_SPANS_HEADER = "x-trace-spans"  # "этап=мс,этап=мс"
+TRACE_SENT_HEADER = "x-trace-sent-ns"  # time.time_ns() отправки, для времени ожидания в брокере
+_TRACE_HEADERS = frozenset((TRACE_ID_HEADER, TRACE_SPANS_HEADER, TRACE_SENT_HEADER))
+
+
+class SampledLogger:
+    """
+    Логирование каждого every-го вызова с одним и тем же шаблоном сообщения.
+    Уровень проверяется до сэмплирования, а аргументы передаются в logging как есть
+    (%-форматирование), поэтому отброшенные записи не форматируются вовсе.
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = 100):
+        self.logger = logger
+        self.every = max(1, every)
+        self._counters: defaultdict[str, Iterator[int]] = defaultdict(itertools.count)
+
+    def log(self, level: int, msg: str, *args: Any) -> None:
+        if self.logger.isEnabledFor(level) and next(self._counters[msg]) % self.every == 0:
+            self.logger.log(level, msg, *args, stacklevel=3)
+
+    def debug(self, msg: str, *args: Any) -> None:
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args: Any) -> None:
+        self.log(logging.INFO, msg, *args)
+
+
+@dataclass
+class SpanStat:
+    """Статистика одного этапа"""
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    recent: deque = field(default_factory=lambda: deque(maxlen=1024))  # Последние значения для перцентилей
+
+    def add(self, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.recent.append(ms)
+
+    def summary(self) -> dict[str, float]:
+        values = sorted(self.recent)
+
+        def percentile(q: float) -> float:
+            return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0.0
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(percentile(50), 3),
+            "p99_ms": round(percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class SpanRegistry:
+    """Агрегированные длительности этапов в рамках процесса"""
+
+    def __init__(self):
+        self.stats: defaultdict[str, SpanStat] = defaultdict(SpanStat)
+
+    def record(self, name: str, ms: float) -> None:
+        self.stats[name].add(ms)
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        return {name: stat.summary() for name, stat in sorted(self.stats.items())}
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+
+spans = SpanRegistry()
+
+
+async def report_spans(interval: float, registry: SpanRegistry = spans) -> None:
+    """Периодический вывод статистики этапов - для процессов без HTTP-эндпоинта (Kafka)"""
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = registry.snapshot()
+        if snapshot:
+            logging.info(
+                "Spans: " + "; ".join(
+                    f"{name} n={stat['count']} p50={stat['p50_ms']} p99={stat['p99_ms']} max={stat['max_ms']} ms"
+                    for name, stat in snapshot.items()
+                )
+            )
+
+
+# id трасс: случайный префикс процесса и счетчик (дешевле uuid4 на каждое сообщение)
+_TRACE_PREFIX = os.urandom(4).hex()
+_trace_ids = itertools.count()
+
+
+class _Span:
+    """Замер одного этапа (класс вместо @contextmanager - без генератора на каждый вызов)"""
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: "Trace", name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, (time.perf_counter_ns() - self.started) / 1e6)
+        return False
+
+
+class Trace:
+    """
+    Трасса одного сообщения: id и длительности этапов в мс, накопленные по всем сервисам.
+    Время в брокере считается по системным часам отправителя и получателя,
+    поэтому между разными хостами оно точно настолько, насколько синхронизированы часы.
+    """
+    __slots__ = ("trace_id", "spans", "sent_ns", "registry")
+
+    def __init__(
+            self,
+            trace_id: Optional[str] = None,
+            spans_ms: Optional[dict[str, float]] = None,
+            sent_ns: Optional[int] = None,
+            registry: SpanRegistry = spans,
+    ):
+        self.trace_id = trace_id or f"{_TRACE_PREFIX}{next(_trace_ids):x}"
+        self.spans = spans_ms or {}
+        self.sent_ns = sent_ns
+        self.registry = registry
+
+    def span(self, name: str) -> _Span:
+        """Замер этапа, выполняемого в этом процессе: with trace.span("handler"): ..."""
+        return _Span(self, name)
+
+    def add(self, name: str, ms: float) -> None:
+        spans_ms = self.spans
+        spans_ms[name] = spans_ms[name] + ms if name in spans_ms else ms
+        self.registry.stats[name].add(ms)
+
+    def received(self, name: str) -> None:
+        """Время от отправки до получения (ожидание в брокере), если отправитель его передал"""
+        if self.sent_ns is not None:
+            self.add(name, max(0.0, (time.time_ns() - self.sent_ns) / 1e6))
+
+    def record_upstream(self) -> None:
+        """Учет в статистике процесса этапов, измеренных отправителями (пришедших в заголовках)"""
+        for name, ms in self.spans.items():
+            self.registry.stats[name].add(ms)
+
+    def merge(self, other: "Trace") -> None:
+        """Добавление этапов, измеренных другим сервисом (например, из ответа на RPC)"""
+        for name, ms in other.spans.items():
+            if name not in self.spans:
+                self.add(name, ms)
+        self.sent_ns = other.sent_ns
+
+    def inject(self, headers: Optional[Mapping[str, Any] | list[tuple[str, Any]]] = None):
+        """Заголовки для отправки: dict для AMQP и Kafka, список пар, если передан список (Kafka)"""
+        trace_headers = {
+            TRACE_ID_HEADER: self.trace_id,
+            TRACE_SPANS_HEADER: ",".join(f"{name}={ms:.3f}" for name, ms in self.spans.items()),
+            TRACE_SENT_HEADER: str(time.time_ns()),
+        }
+        if isinstance(headers, list):
+            return [*headers, *trace_headers.items()]
+        return {**(headers or {}), **trace_headers}
+
+    @classmethod
+    def extract(
+            cls,
+            headers: Optional[Mapping[str, Any] | list[tuple[str, Any]]],
+            registry: SpanRegistry = spans,
+    ) -> "Trace":
+        """Трасса из заголовков: dict (AMQP) или список пар (Kafka), значения str или bytes"""
+        # isinstance(headers, Mapping) заметно медленнее проверки атрибута на горячем пути
+        items = headers.items() if hasattr(headers, "items") else (headers or ())
+        values = {}
+        for key, value in items:
+            if key in _TRACE_HEADERS:
+                values[key] = value.decode() if isinstance(value, bytes) else str(value)
+        try:
+            spans_ms = {
+                name: float(ms)
+                for name, _, ms in (item.partition("=") for item in values[TRACE_SPANS_HEADER].split(","))
+            } if values.get(TRACE_SPANS_HEADER) else None
+            sent_ns = int(values[TRACE_SENT_HEADER]) if TRACE_SENT_HEADER in values else None
+        except ValueError:
+            # Битые заголовки не должны ломать обработку сообщения
+            spans_ms, sent_ns = None, None
+        return cls(values.get(TRACE_ID_HEADER), spans_ms, sent_ns, registry)
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик: фоновый поток раз в interval снимает стеки всех потоков
+    (sys._current_frames) и считает одинаковые стеки. В отличие от cProfile не замедляет
+    каждый вызов функции, поэтому его можно включать на работающем сервисе.
+    """
+
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self.interval = 0.005
+        self.duration: Optional[float] = None
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self._names: dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005, duration: Optional[float] = None) -> bool:
+        """Запуск сбора сэмплов; duration - автоматическая остановка через N секунд"""
+        if self.running:
+            return False
+        self.interval = interval
+        self.duration = duration
+        self.samples = 0
+        self.stacks = Counter()
+        self.started_at = time.time()
+        self.stopped_at = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logging.info(f"Sampling profiler started: interval={interval * 1000:.1f} ms, duration={duration}")
+        return True
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            logging.info(f"Sampling profiler stopped: {self.samples} samples")
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.duration if self.duration else None
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[self._stack(frame)] += 1
+            self.samples += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self.stopped_at = time.time()
+
+    def _stack(self, frame) -> tuple[str, ...]:
+        """Стек от корня к текущей функции"""
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            name = self._names.get(code)
+            if name is None:
+                name = self._names[code] = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+            stack.append(name)
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "duration": self.duration,
+            "samples": self.samples,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
+
+    def top(self, limit: int = 30) -> list[dict[str, Any]]:
+        """Функции с наибольшим числом сэмплов: own - на вершине стека, total - где-либо в стеке"""
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        stacks = list(self.stacks.items())
+        for stack, count in stacks:
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        all_samples = sum(count for _, count in stacks) or 1
+        return [
+            {
+                "function": name,
+                "own": own[name],
+                "total": count,
+                "own_percent": round(own[name] * 100 / all_samples, 2),
+                "total_percent": round(count * 100 / all_samples, 2),
+            }
+            for name, count in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:limit]
+        ]
+
+    def collapsed(self) -> str:
+        """Стеки в формате collapsed (flamegraph.pl, speedscope)"""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in list(self.stacks.items()))
+
+
+profiler = SamplingProfiler()
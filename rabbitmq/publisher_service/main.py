@@ -1,6 +1,7 @@
 import uvicorn
 from fastapi import FastAPI
 
+from debug import debug_router
 from websocket import websocket_router
 
 app = FastAPI(
@@ -8,6 +9,7 @@ app = FastAPI(
 )
 
 app.include_router(websocket_router)
+app.include_router(debug_router)
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -17,6 +17,9 @@ from aio_pika import (
 from aio_pika.abc import AbstractIncomingMessage, AbstractQueue
 
 from config import settings
+from instrumentation import SampledLogger, Trace
+
+log = SampledLogger(logging.getLogger(__name__), settings.log_sample_every)
 
 exchange_map = {
     ExchangeType.DIRECT: "direct_exchange",
@@ -76,9 +79,9 @@ class RabbitMQProducer:
                     await self.callback_queue.bind(self.exchange)
 
                 elif self.exchange_type == ExchangeType.TOPIC:
-                    # Для TOPIC: используем pattern-based routing
-                    # Например, все ответы будут приходить с routing_key pattern "response.*"
-                    topic_routing_key = f"response.*"
+                    # Для TOPIC: ответы приходят с routing_key "response.<имя callback очереди>".
+                    # Имя вида amq.gen-... содержит точки, поэтому шаблон "response.*" его не покрывает
+                    topic_routing_key = f"response.{self.callback_queue.name}"
                     await self.callback_queue.bind(
                         self.exchange,
                         routing_key=topic_routing_key
@@ -136,7 +139,8 @@ class RabbitMQProducer:
         try:
             future = self.futures.pop(message.correlation_id)
             if not future.done():
-                future.set_result(message.body)
+                # Целиком: кроме тела нужны заголовки с этапами обработки на стороне consumer
+                future.set_result(message)
         except KeyError:
             logging.warning(f"Unknown correlation_id: {message.correlation_id}")
         except Exception as e:
@@ -156,25 +160,36 @@ class RabbitMQProducer:
         loop = asyncio.get_running_loop()
         future = loop.create_future()
         self.futures[correlation_id] = future
+        trace = Trace()
         try:
+            with trace.span("publish.serialize"):
+                body = json.dumps(event, default=self.json_serializer).encode()
             # Создаем сообщение
             message = Message(
-                body=json.dumps(event, default=self.json_serializer).encode(),
+                body=body,
                 correlation_id=correlation_id,
                 reply_to=self.callback_queue.name,
                 content_type="application/json",
                 expiration=int(timeout * 1000),
+                headers=trace.inject(),
             )
             # Для FANOUT exchange routing_key игнорируется
             if self.exchange_type == ExchangeType.FANOUT:
                 routing_key = ""
 
-            await self.exchange.publish(message, routing_key=routing_key, mandatory=True)
-            logging.debug(f"Message published to {routing_key}: {event}")
-            # Ждем ответа с таймаутом
-            response_body = await asyncio.wait_for(future, timeout=timeout)
-            response_data = json.loads(response_body.decode())
-            logging.debug(f"Received response: {response_data}")
+            with trace.span("rpc.total"):
+                with trace.span("publish.send"):
+                    await self.exchange.publish(message, routing_key=routing_key, mandatory=True)
+                log.debug("Message published to %s: %s", routing_key, event)
+                # Ждем ответа с таймаутом
+                response = await asyncio.wait_for(future, timeout=timeout)
+            # Этапы consumer (ожидание в брокере, обработчик, WebSocket) и ожидание ответа в брокере
+            trace.merge(Trace.extract(response.headers))
+            trace.received("reply.broker_wait")
+            with trace.span("reply.deserialize"):
+                response_data = json.loads(response.body.decode())
+            log.debug("Received response: %s", response_data)
+            log.debug("Trace %s: %s", trace.trace_id, trace.spans)
             return response_data
         except asyncio.TimeoutError:
             logging.error(f"Timeout waiting for response to {correlation_id}")